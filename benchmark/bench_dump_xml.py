@@ -0,0 +1,77 @@
+import sys
+sys.path.append('.')
+import time
+import logging
+import argparse
+import tempfile
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from predet.dataset.xml_format import XmlFormat, indent
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="benchmark xml serializer")
+    parser.add_argument('--obj-nums', type=int, nargs='+', default=[1, 10000],
+                        help='object numbers per xml, default 1 10000')
+    parser.add_argument('--seconds', type=float, default=1.0,
+                        help='min seconds per case, default 1.0')
+    return parser.parse_args()
+
+
+def dumps_xml_etree(img_info, obj_info, out_path):
+    ''' ElementTree + indent() reference writer (previous implementation)
+    '''
+    p = Path(out_path)
+    out_dir, xml_name = p.parent.resolve(), p.name
+    root = ET.Element('annotation')
+    ET.SubElement(root, 'folder').text = str(out_dir)
+    img_ext = img_info[0].split('.')[-1]
+    img_name = xml_name.replace('.xml', '.'+img_ext)
+    ET.SubElement(root, 'filename').text = img_name
+    ET.SubElement(root, 'path').text = str(out_dir.joinpath(img_name))
+    size = ET.SubElement(root, 'size')
+    ET.SubElement(size, 'width').text = str(img_info[1])
+    ET.SubElement(size, 'height').text = str(img_info[2])
+    ET.SubElement(size, 'depth').text = str(img_info[3])
+    for obj_name, bbox in obj_info.items():
+        for box in bbox:
+            object_root = ET.SubElement(root, 'object')
+            ET.SubElement(object_root, 'name').text = obj_name
+            ET.SubElement(object_root, 'pose').text = "Unspecified"
+            ET.SubElement(object_root, 'truncated').text = "0"
+            ET.SubElement(object_root, 'difficult').text = "0"
+            bndbox = ET.SubElement(object_root, 'bndbox')
+            for tag, value in zip(('xmin', 'ymin', 'xmax', 'ymax'), box):
+                ET.SubElement(bndbox, tag).text = str(int(value))
+    indent(root)
+    return ET.tostring(root)
+
+
+def bench(fn, args, seconds):
+    n, t1 = 0, time.perf_counter()
+    while time.perf_counter() - t1 < seconds:
+        fn(*args)
+        n += 1
+    return (time.perf_counter() - t1) / n
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        out_path = str(Path(tmp_dir).joinpath('bench.xml'))
+        for obj_num in args.obj_nums:
+            img_info = ['bench.jpg', 1920, 1080, 3]
+            obj_info = {'car': [[i % 1900, i % 1000, i % 1900 + 20, i % 1000 + 80]
+                                for i in range(obj_num // 2)],
+                        'person & <dog>': [[1, 2, 3, 4]] * (obj_num - obj_num // 2)}
+            assert XmlFormat.dumps_xml(img_info, obj_info, out_path) == \
+                dumps_xml_etree(img_info, obj_info, out_path), "output differs!"
+            t_old = bench(dumps_xml_etree, (img_info, obj_info, out_path), args.seconds)
+            t_new = bench(XmlFormat.dumps_xml, (img_info, obj_info, out_path), args.seconds)
+            t_dump = bench(XmlFormat.dump_xml, (img_info, obj_info, out_path), args.seconds)
+            logger.info(f"{obj_num} objects: etree {t_old*1e3:.3f} ms, dumps_xml "
+                        f"{t_new*1e3:.3f} ms ({t_old/t_new:.1f}x), dump_xml with write "
+                        f"{t_dump*1e3:.3f} ms")
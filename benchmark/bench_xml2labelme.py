@@ -0,0 +1,59 @@
+import sys
+sys.path.append('.')
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+from pathlib import Path
+from predet.dataset.xml2labelme import Xml2labelme
+from benchmark.synthetic import make_xml_dataset
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="benchmark xml to labelme convert")
+    parser.add_argument('--num', type=int, default=5000,
+                        help='synthetic xml number, default 5000')
+    parser.add_argument('--obj-num', type=int, default=20,
+                        help='object number in each xml, default 20')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help='thread numbers to benchmark')
+    parser.add_argument('--processes', type=int, nargs='+', default=[2, 4],
+                        help='process numbers to benchmark')
+    parser.add_argument('--indent', type=int, default=None,
+                        help='json indent, default None (compact)')
+    return parser.parse_args()
+
+
+def bench(convertor, method, workers, num):
+    shutil.rmtree(convertor.out_dir, ignore_errors=True)
+    t1 = time.time()
+    if method == 'thread' and workers == 1:
+        convertor.convert()
+    elif method == 'thread':
+        convertor.convert_thread(workers)
+    else:
+        convertor.convert_process(workers)
+    t2 = time.time()
+    return num / (t2 - t1)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        xml_dir = Path(tmp_dir).joinpath('xml')
+        out_dir = Path(tmp_dir).joinpath('json')
+        make_xml_dataset(str(xml_dir), args.num, args.obj_num)
+        convertor = Xml2labelme(str(xml_dir), str(out_dir), ['car', 'person'],
+                                indent=args.indent)
+        results = []
+        for threads in args.threads:
+            results.append(('thread', threads, bench(convertor, 'thread', threads, args.num)))
+        for processes in args.processes:
+            results.append(('process', processes, bench(convertor, 'process', processes, args.num)))
+
+    for method, workers, fps in results:
+        logger.info(f"{method:>8s} x {workers:<3d}: {fps:.1f} files/s")
@@ -0,0 +1,149 @@
+import sys
+sys.path.append('.')
+import os
+import json
+import time
+import logging
+import argparse
+import platform
+import subprocess
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+ROOT = Path(__file__).absolute().parent.parent
+# module: cumulative import time budget (ms) reported by python -X importtime
+MODULES = {
+    'predet.dataset.xml_format': 30,
+    'predet.dataset.annotation': 20,
+    'predet.dataset.coco_format': 50,
+    'predet.dataset.xml2coco': 80,
+    'predet.dataset.xml2yolo': 80,
+    'predet.dataset.xml2labelme': 80,
+    'predet.dataset.dota2xml': 80,
+    'predet.dataset.coco2xml': 80,
+    'predet.dataset.coco2yolo': 80,
+    'predet.dataset.xml_validate': 80,
+    'predet.transform.image_slice': 100,
+    'predet.utils.file_io': 30,
+    'predet.cli': 50,
+    'predet.dataset.xml_stats': 150,
+    'predet.transform.slice_search': 150,
+}
+# modules which must stay out of sys.modules after importing the above,
+# except for xml_stats and slice_search where numpy does the work
+HEAVY = ('numpy', 'PIL', 'tqdm', 'ijson', 'multiprocessing', 'urllib.request',
+         'concurrent.futures.process')
+EAGER_NUMPY = ('predet.dataset.xml_stats', 'predet.transform.slice_search')
+# demo script: wall time budget (ms) of `python <demo> --help`, interpreter
+# startup included
+DEMOS = {
+    'demo/demo_xml2coco.py': 150,
+    'demo/demo_xml2yolo.py': 150,
+    'demo/demo_xml2labelme.py': 150,
+    'demo/demo_dota2xml.py': 150,
+    'demo/demo_coco2xml.py': 150,
+    'demo/demo_coco2yolo.py': 150,
+    'demo/demo_validate_xml.py': 150,
+    'demo/demo_image_slice.py': 200,
+    'demo/demo_xml_stats.py': 300,
+    'demo/demo_slice_search.py': 300,
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="predet import time budget check")
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='repeat number, the best time is kept, default 5')
+    parser.add_argument('--scale', type=float, default=1.0,
+                        help='budget scale factor for slower machines, default 1.0')
+    parser.add_argument('--only', type=str, nargs='+', default=None,
+                        help='only check modules or demos starting with these prefixes')
+    parser.add_argument('--json', type=str, default=None,
+                        help='save results to this json path')
+    return parser.parse_args()
+
+
+def import_time(module: str, repeat: int):
+    ''' best cumulative import time (ms) of module in a fresh interpreter and
+    the modules loaded by it
+    '''
+    code = f"import sys; import {module}; print(' '.join(sys.modules))"
+    best, loaded = float('inf'), []
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                              cwd=ROOT, capture_output=True, text=True, check=True)
+        for line in reversed(proc.stderr.splitlines()):
+            fields = line.split('|')
+            if len(fields) == 3 and fields[2].strip() == module:
+                best = min(best, int(fields[1]) / 1000)
+                break
+        loaded = proc.stdout.split()
+    return best, loaded
+
+
+def startup_time(script: str, repeat: int) -> float:
+    ''' best wall time (ms) of `python script --help`
+    '''
+    best = float('inf')
+    for _ in range(repeat):
+        t1 = time.perf_counter()
+        subprocess.run([sys.executable, script, '--help'], cwd=ROOT,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        best = min(best, (time.perf_counter() - t1) * 1000)
+    return best
+
+
+def heavy_modules(loaded, allow_numpy=False):
+    heavy = []
+    for name in loaded:
+        for prefix in HEAVY:
+            if name == prefix or name.startswith(prefix + '.'):
+                if not (allow_numpy and prefix == 'numpy'):
+                    heavy.append(prefix)
+    return sorted(set(heavy))
+
+
+def selected(name: str, only) -> bool:
+    return only is None or any(name.startswith(prefix) for prefix in only)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    results, violations = {}, []
+    for module, budget in MODULES.items():
+        if not selected(module, args.only):
+            continue
+        ms, loaded = import_time(module, args.repeat)
+        heavy = heavy_modules(loaded, allow_numpy=module in EAGER_NUMPY)
+        budget = budget * args.scale
+        results[module] = dict(ms=round(ms, 2), budget=budget, heavy=heavy)
+        flag = ''
+        if ms > budget or heavy:
+            violations.append(module)
+            flag = '  <-- over budget' if ms > budget else f'  <-- loads {heavy}'
+        logger.info(f"{module}: {ms:.1f}ms / {budget:.0f}ms{flag}")
+
+    for script, budget in DEMOS.items():
+        if not selected(script, args.only):
+            continue
+        ms = startup_time(script, args.repeat)
+        budget = budget * args.scale
+        results[script] = dict(ms=round(ms, 2), budget=budget)
+        flag = ''
+        if ms > budget:
+            violations.append(script)
+            flag = '  <-- over budget'
+        logger.info(f"{script} --help: {ms:.1f}ms / {budget:.0f}ms{flag}")
+
+    if args.json:
+        meta = dict(python=platform.python_version(), platform=platform.platform(),
+                    cpu_count=os.cpu_count(), time=time.strftime('%Y-%m-%d %H:%M:%S'))
+        with open(args.json, 'w') as f:
+            json.dump(dict(meta=meta, results=results), f, indent=2)
+        logger.info(f"results saved to {args.json}")
+
+    if violations:
+        logger.error(f"{len(violations)} entries over import budget: {violations}")
+        sys.exit(1)
@@ -0,0 +1,167 @@
+import sys
+sys.path.append('.')
+import os
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+from pathlib import Path
+from predet.dataset.xml_format import XmlFormat
+from predet.dataset.xml2coco import Xml2Coco
+from predet.dataset.xml2yolo import Xml2Yolo
+from predet.dataset.xml2labelme import Xml2labelme
+from predet.dataset.dota2xml import Dota2Xml
+from predet.transform.image_slice import ImageSlice
+from benchmark.synthetic import make_xml_dataset, make_dota_dataset, make_image_dataset
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+CLASSES = ['car', 'person']
+# (xml number, objects per xml, dota number, slice image number, slice image size)
+SIZES = {
+    'small': (1000, 20, 100, 2, (2000, 1500)),
+    'medium': (10000, 50, 1000, 8, (4000, 3000)),
+    'large': (100000, 50, 5000, 32, (8000, 6000)),
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="predet benchmark suite")
+    parser.add_argument('out_json', type=str,
+                        help='output benchmark result json path')
+    parser.add_argument('--sizes', type=str, nargs='+', default=['small'],
+                        choices=list(SIZES.keys()), help='dataset sizes, default small')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4],
+                        help='thread numbers to benchmark, default 1 4')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='repeat number, the best time is kept, default 3')
+    parser.add_argument('--only', type=str, nargs='+', default=None,
+                        help='only run benchmarks whose name starts with these prefixes')
+    parser.add_argument('--baseline', type=str, default=None,
+                        help='baseline result json to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='allowed slowdown ratio against baseline, default 0.1')
+    parser.add_argument('--work-dir', type=str, default=None,
+                        help='directory for synthetic data, default a temporary directory')
+    return parser.parse_args()
+
+
+def timeit(fn, repeat, setup=None):
+    ''' best wall time of fn over repeat runs, setup runs before each
+    '''
+    best = float('inf')
+    for _ in range(repeat):
+        if setup:
+            setup()
+        t1 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t1)
+    return best
+
+
+def run_thread(obj, threads, single, multi):
+    return getattr(obj, single)() if threads == 1 else getattr(obj, multi)(threads)
+
+
+def bench_size(root: Path, size: str, threads_list, repeat, selected):
+    xml_num, obj_num, dota_num, img_num, img_size = SIZES[size]
+    xml_dir = root.joinpath('xml')
+    out_dir = root.joinpath('out')
+    reset = lambda: shutil.rmtree(out_dir, ignore_errors=True)
+
+    logger.info(f"[{size}] generating synthetic data ...")
+    xml_list = make_xml_dataset(str(xml_dir), xml_num, obj_num)
+    make_dota_dataset(root.joinpath('dota_img'), root.joinpath('dota_txt'), dota_num)
+    make_image_dataset(root.joinpath('img'), root.joinpath('img_xml'), img_num,
+                       img_size=img_size)
+
+    cases = {}
+    cases['parse_xml_info'] = (
+        xml_num, lambda: [XmlFormat.parse_xml_info(p) for p in xml_list], None)
+    cases['parse_annotation'] = (
+        xml_num, lambda: [XmlFormat.parse_annotation(p) for p in xml_list], None)
+    cases['dump_xml'] = (
+        xml_num, lambda: [XmlFormat.dump_xml(*XmlFormat.parse_xml_info(p), str(out_dir.joinpath(
+            Path(p).name))) for p in xml_list], lambda: (reset(), out_dir.mkdir()))
+    cases['xml2coco'] = (
+        xml_num, lambda: Xml2Coco(str(xml_dir), str(root.joinpath('coco.json')), CLASSES).convert(),
+        None)
+    for threads in threads_list:
+        cases[f'xml2yolo/threads={threads}'] = (
+            xml_num, lambda t=threads: run_thread(
+                Xml2Yolo(str(xml_dir), str(out_dir), CLASSES), t, 'convert', 'convert_thread'),
+            reset)
+        cases[f'xml2labelme/threads={threads}'] = (
+            xml_num, lambda t=threads: run_thread(
+                Xml2labelme(str(xml_dir), str(out_dir), CLASSES), t, 'convert', 'convert_thread'),
+            reset)
+        cases[f'dota2xml/threads={threads}'] = (
+            dota_num, lambda t=threads: run_thread(
+                Dota2Xml(str(root.joinpath('dota_img')), str(root.joinpath('dota_txt')),
+                         str(out_dir)), t, 'convert', 'convert_threads'),
+            reset)
+        cases[f'image_slice/threads={threads}'] = (
+            img_num, lambda t=threads: run_thread(
+                ImageSlice(str(root.joinpath('img')), str(out_dir), str(root.joinpath('img_xml')),
+                           ext='png'), t, 'run', 'run_thread'),
+            reset)
+
+    results = {}
+    for name, (num, fn, setup) in cases.items():
+        if selected and not any(name.startswith(s) for s in selected):
+            continue
+        seconds = timeit(fn, repeat, setup)
+        key = f'{size}/{name}'
+        results[key] = dict(items=num, seconds=seconds, items_per_second=num / seconds)
+        logger.info(f"{key}: {seconds:.3f}s, {num / seconds:.1f} items/s")
+    reset()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    ''' compare with baseline results, return names slower than tolerance
+    '''
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['seconds'] / baseline[name]['seconds']
+        flag = ''
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            flag = '  <-- slower'
+        logger.info(f"{name}: {ratio:.2f}x baseline time{flag}")
+    return regressions
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    results = {}
+    for size in args.sizes:
+        if args.work_dir:
+            root = Path(args.work_dir).joinpath(size)
+            shutil.rmtree(root, ignore_errors=True)
+            root.mkdir(parents=True)
+            results.update(bench_size(root, size, args.threads, args.repeat, args.only))
+        else:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                results.update(bench_size(Path(tmp_dir), size, args.threads,
+                                          args.repeat, args.only))
+
+    meta = dict(python=platform.python_version(), platform=platform.platform(),
+                cpu_count=os.cpu_count(), time=time.strftime('%Y-%m-%d %H:%M:%S'))
+    with open(args.out_json, 'w') as f:
+        json.dump(dict(meta=meta, results=results), f, indent=2)
+    logger.info(f"results saved to {args.out_json}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            logger.error(f"{len(regressions)} benchmarks slower than baseline: {regressions}")
+            sys.exit(1)
@@ -0,0 +1,90 @@
+import sys
+sys.path.append('.')
+import random
+import shutil
+from pathlib import Path
+from predet.dataset.xml_format import XmlFormat
+
+
+def make_xml_dataset(out_dir: str, num: int, obj_num=20,
+                     img_size=(1920, 1080), classes=('car', 'person'),
+                     img_ext='.jpg', seed=0):
+    ''' generate synthetic voc xml annotations
+
+    Args:
+        out_dir: [str], output xml directory
+        num: [int], xml file number
+        obj_num: [int], object number in each xml
+        img_size: [tuple], (W, H) written to size field
+        classes: [tuple], object names to sample from
+        img_ext: [str], image extension used in filename field
+        seed: [int], random seed
+
+    Return:
+        xml_list: [list], generated xml paths
+    '''
+    rng = random.Random(seed)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    img_w, img_h = img_size
+    xml_list = []
+    for i in range(num):
+        obj_info = {}
+        for _ in range(obj_num):
+            bw = rng.randint(4, max(5, img_w // 8))
+            bh = rng.randint(4, max(5, img_h // 8))
+            x1 = rng.randint(0, img_w - bw)
+            y1 = rng.randint(0, img_h - bh)
+            name = rng.choice(classes)
+            obj_info.setdefault(name, []).append([x1, y1, x1+bw, y1+bh])
+        xml_path = str(out_dir.joinpath(f'{i:08d}.xml'))
+        XmlFormat.dump_xml([f'{i:08d}{img_ext}', img_w, img_h, 3],
+                           obj_info, xml_path)
+        xml_list.append(xml_path)
+    return xml_list
+
+
+def make_dota_dataset(img_dir: str, txt_dir: str, num: int, obj_num=50,
+                      img_size=(4000, 3000), classes=('plane', 'small-vehicle'), seed=0):
+    ''' generate synthetic dota rect labels and small placeholder png images
+
+    Dota2Xml only reads the image header, so the png is a solid image
+    with the given size (cheap to write, large header size).
+    '''
+    from PIL import Image
+    rng = random.Random(seed)
+    img_dir, txt_dir = Path(img_dir), Path(txt_dir)
+    img_dir.mkdir(parents=True, exist_ok=True)
+    txt_dir.mkdir(parents=True, exist_ok=True)
+    img_w, img_h = img_size
+    Image.new('L', img_size).save(img_dir.joinpath('P00000000.png'))
+    for i in range(num):
+        name = f'P{i:08d}'
+        if i > 0:
+            shutil.copyfile(img_dir.joinpath('P00000000.png'), img_dir.joinpath(name+'.png'))
+        rows = ['imagesource:GoogleEarth\n', 'gsd:0.146343590398\n']
+        for _ in range(obj_num):
+            cx, cy = rng.randint(20, img_w-20), rng.randint(20, img_h-20)
+            r = rng.randint(4, 19)
+            poly = [cx-r, cy-r, cx+r, cy-r, cx+r, cy+r, cx-r, cy+r]
+            rows.append(' '.join(map(str, poly)) + f' {rng.choice(classes)} {rng.randint(0, 1)}\n')
+        with txt_dir.joinpath(name+'.txt').open('w') as f:
+            f.writelines(rows)
+
+
+def make_image_dataset(img_dir: str, xml_dir: str, num: int, img_size=(4000, 3000),
+                       ext='png', obj_num=50, seed=0):
+    ''' generate synthetic images (noise over a gradient) with xml annotations
+    '''
+    import numpy as np
+    from PIL import Image
+    rng = np.random.default_rng(seed)
+    img_dir = Path(img_dir)
+    img_dir.mkdir(parents=True, exist_ok=True)
+    img_w, img_h = img_size
+    gradient = np.linspace(0, 200, img_w, dtype=np.float32)[None, :, None]
+    for i in range(num):
+        noise = rng.integers(0, 40, (img_h, img_w, 3), dtype=np.uint8)
+        img = (noise + gradient).astype(np.uint8)
+        Image.fromarray(img).save(img_dir.joinpath(f'{i:08d}.{ext}'))
+    make_xml_dataset(xml_dir, num, obj_num, img_size, img_ext='.'+ext, seed=seed)
@@ -0,0 +1,58 @@
+import sys
+sys.path.append('.')
+import time
+import argparse
+import logging
+from predet.dataset.coco2yolo import Coco2Yolo
+from predet.utils.profiler import Profiler
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="coco to yolo annotations")
+    parser.add_argument('json_path', type=str,
+                        help='coco json path')
+    parser.add_argument('out_dir', type=str,
+                        help='output yolo directory')
+    parser.add_argument('--cls-txt', type=str, default=None,
+                        help='class txt file, default None (coco categories)')
+    parser.add_argument('--stream', action='store_true',
+                        help='parse json incrementally with ijson, for large files')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='threads num for multi-threads')
+    parser.add_argument('--num-shards', type=int, default=1,
+                        help='total shard number for distributed runs, default 1')
+    parser.add_argument('--shard-index', type=int, default=0,
+                        help='shard index of this run, default 0')
+    parser.add_argument('--shard-balance', action='store_true',
+                        help='balance shards by object number')
+    parser.add_argument('--resume', action='store_true',
+                        help='skip inputs finished by a previous --resume run')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='serialize in threads num processes, write in threads')
+    parser.add_argument('--profile', type=str, default=None,
+                        help='save per-stage timing summary to this json path')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    profiler = Profiler() if args.profile else None
+    convertor = Coco2Yolo(args.json_path, args.out_dir, args.cls_txt, args.stream,
+                          args.num_shards, args.shard_index, args.shard_balance,
+                          args.resume, profiler)
+    t1 = time.time()
+    threads = max(1, args.threads)
+    if args.pipeline:
+        convertor.convert_pipeline(workers=threads)
+    elif threads == 1:
+        convertor.convert()
+    else:
+        convertor.convert_thread(threads)
+    t2 = time.time()
+    logger.info(f"converted finished in {t2-t1} seconds")
+    if profiler:
+        profiler.to_json(args.profile)
+        logger.info(f"profile summary saved to {args.profile}")
@@ -0,0 +1,35 @@
+import sys
+sys.path.append('.')
+import time
+import logging
+import argparse
+from predet.dataset.dataset_dedup import DatasetDedup
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="find duplicate images among datasets")
+    parser.add_argument('out_json', type=str,
+                        help='output duplicate report path')
+    parser.add_argument('--dataset', type=str, nargs='+', action='append', required=True,
+                        help='image directory and optional xml directory, can be repeated')
+    parser.add_argument('--img-ext', type=str, nargs='+', default=['.jpg', '.png'],
+                        help='image extensions, default .jpg .png')
+    parser.add_argument('--threads', type=int, default=8,
+                        help='threads num for hashing, default 8')
+    parser.add_argument('--cache', type=str, default=None,
+                        help='hash cache path, default None')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    datasets = [(d[0], d[1] if len(d) > 1 else None) for d in args.dataset]
+    dedup = DatasetDedup(datasets, args.img_ext, args.threads, args.cache)
+    t1 = time.time()
+    dedup.find()
+    dedup.save_report(args.out_json)
+    t2 = time.time()
+    logger.info(f"finished in {t2-t1} seconds")
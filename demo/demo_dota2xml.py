@@ -4,6 +4,7 @@ import time
 import logging
 import argparse
 from predet.dataset.dota2xml import Dota2Xml
+from predet.utils.profiler import Profiler
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -21,18 +22,38 @@ def parse_args():
                         help="with difficult")
     parser.add_argument('--threads', type=int, default=1,
                         help='threads num for multi-threads')
+    parser.add_argument('--num-shards', type=int, default=1,
+                        help='total shard number for distributed runs, default 1')
+    parser.add_argument('--shard-index', type=int, default=0,
+                        help='shard index of this run, default 0')
+    parser.add_argument('--shard-balance', action='store_true',
+                        help='balance shards by input size')
+    parser.add_argument('--resume', action='store_true',
+                        help='skip inputs finished by a previous --resume run')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='overlap reading, converting (threads num processes) and writing')
+    parser.add_argument('--profile', type=str, default=None,
+                        help='save per-stage timing summary to this json path')
     return parser.parse_args()
 
 
 if __name__ == '__main__':
     args = parse_args()
-    convertor = Dota2Xml(args.img_dir, args.txt_dir, args.out_dir, args.difficult)
+    profiler = Profiler() if args.profile else None
+    convertor = Dota2Xml(args.img_dir, args.txt_dir, args.out_dir, args.difficult,
+                         args.num_shards, args.shard_index, args.shard_balance,
+                         args.resume, profiler)
     t1 = time.time()
     threads = max(1, args.threads)
     logger.info(f"converting with {threads} processes:")
-    if threads == 1:
+    if args.pipeline:
+        convertor.convert_pipeline(workers=threads)
+    elif threads == 1:
         convertor.convert()
     else:
         convertor.convert_threads(threads)
     t2 = time.time()
     logger.info(f"converted finished in {t2-t1} seconds")
+    if profiler:
+        profiler.to_json(args.profile)
+        logger.info(f"profile summary saved to {args.profile}")
@@ -1,9 +1,11 @@
 import sys
 sys.path.append('.')
 import time
+import json
 import argparse
 import logging
 from predet.transform.image_slice import ImageSlice
+from predet.utils.profiler import Profiler
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -24,23 +26,62 @@ def parse_args():
                         help='slice patch overlap, default 0.5')
     parser.add_argument('--threads', type=int, default=1,
                         help='threads num for multi-threads, default 1')
+    parser.add_argument('--plan', type=str, default=None,
+                        help='dry run, save the slice plan to this json path')
+    parser.add_argument('--plan-sample', type=int, default=0,
+                        help='images sliced to estimate run time in dry run, default 0')
+    parser.add_argument('--num-shards', type=int, default=1,
+                        help='total shard number for distributed runs, default 1')
+    parser.add_argument('--shard-index', type=int, default=0,
+                        help='shard index of this run, default 0')
+    parser.add_argument('--shard-balance', action='store_true',
+                        help='balance shards by input size')
+    parser.add_argument('--resume', action='store_true',
+                        help='skip inputs finished by a previous --resume run')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='overlap reading, converting (threads num processes) and writing')
+    parser.add_argument('--out-format', type=str, default='xml', choices=('xml', 'coco'),
+                        help='tile annotations, one xml per tile or one coco json, default xml')
+    parser.add_argument('--classes', type=str, default=None,
+                        help='class txt file, required by coco output')
+    parser.add_argument('--coco-path', type=str, default=None,
+                        help='coco json save path, default annotations.json in out_dir')
+    parser.add_argument('--profile', type=str, default=None,
+                        help='save per-stage timing summary to this json path')
     return parser.parse_args()
 
 
 if __name__ == '__main__':
     args = parse_args()
+    profiler = Profiler() if args.profile else None
     patch_size = (args.width, args.height)
     overlap = args.overlap
     img_slice = ImageSlice(args.img_dir, args.out_dir, args.xml_dir,
                            slice_size=patch_size, overlap_ratio=(overlap, overlap),
-                           min_area_ratio=0.2, ext='png')
-    
+                           min_area_ratio=0.2, ext='png',
+                           num_shards=args.num_shards, shard_index=args.shard_index,
+                           shard_balance=args.shard_balance, resume=args.resume,
+                           profiler=profiler, out_format=args.out_format,
+                           classes=args.classes, coco_path=args.coco_path)
+
+    if args.plan:
+        plan = img_slice.plan(args.plan_sample)
+        with open(args.plan, 'w') as f:
+            json.dump(plan, f, indent=2)
+        logger.info(f"slice plan: {plan['total']}")
+        sys.exit(0)
+
     t1 = time.time()
     threads = max(1, args.threads)
     logger.info(f"converting with {threads} processes:")
-    if threads == 1:
+    if args.pipeline:
+        img_slice.run_pipeline(workers=threads)
+    elif threads == 1:
         img_slice.run()
     else:
         img_slice.run_thread(threads)
     t2 = time.time()
-    logger.info(f"converted finished in {t2-t1} seconds")
\ No newline at end of file
+    logger.info(f"converted finished in {t2-t1} seconds")
+    if profiler:
+        profiler.to_json(args.profile)
+        logger.info(f"profile summary saved to {args.profile}")
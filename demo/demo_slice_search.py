@@ -0,0 +1,54 @@
+import sys
+sys.path.append('.')
+import time
+import json
+import logging
+import argparse
+from predet.transform.slice_search import SliceSearch
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="anchor and slice size recommendation")
+    parser.add_argument('xml_dir', type=str,
+                        help='xml directory of original (not sliced) images')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[512, 640, 800, 1024],
+                        help='square slice sizes to simulate')
+    parser.add_argument('--overlaps', type=float, nargs='+', default=[0.1, 0.2, 0.5],
+                        help='overlap ratios to simulate')
+    parser.add_argument('--min-area-ratio', type=float, default=0.2,
+                        help='min area ratio of ImageSlice, default 0.2')
+    parser.add_argument('--anchors', type=int, default=9,
+                        help='anchor number, 0 to skip, default 9')
+    parser.add_argument('--processes', type=int, default=4,
+                        help='processes num for xml parsing, default 4')
+    parser.add_argument('--out-json', type=str, default=None,
+                        help='output result json path, default None')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    t1 = time.time()
+    search = SliceSearch(args.xml_dir, args.processes)
+    result = {}
+    if args.anchors > 0:
+        anchors, mean_iou = search.anchors(args.anchors)
+        result['anchors'] = anchors.round(1).tolist()
+        result['anchor_mean_iou'] = mean_iou
+        logger.info(f"anchors: {result['anchors']}, mean iou: {mean_iou:.3f}")
+
+    sizes = [(s, s) for s in args.sizes]
+    overlaps = [(o, o) for o in args.overlaps]
+    result['slices'] = search.sweep(sizes, overlaps, args.min_area_ratio)
+    for r in result['slices']:
+        logger.info(f"size {r['slice_size']} overlap {r['overlap_ratio']}: "
+                    f"{r['tile_num']} tiles, {r['instance_num']} instances, "
+                    f"{r['cut_num']} cut, {r['lost_num']}/{r['object_num']} lost")
+    t2 = time.time()
+    if args.out_json:
+        with open(args.out_json, 'w') as f:
+            json.dump(result, f, indent=2)
+    logger.info(f"finished in {t2-t1} seconds")
@@ -0,0 +1,42 @@
+import sys
+sys.path.append('.')
+import time
+import json
+import logging
+import argparse
+from predet.dataset.xml_validate import XmlValidator, MODES
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="validate and repair xml annotations")
+    parser.add_argument('xml_dir', type=str,
+                        help='xml directory')
+    parser.add_argument('--img-dir', type=str, default=None,
+                        help='image directory to check size fields, default None')
+    parser.add_argument('--img-ext', type=str, default='jpg',
+                        help='image format, default jpg')
+    parser.add_argument('--mode', type=str, default='report', choices=MODES,
+                        help='report only, clip or drop bad boxes, default report')
+    parser.add_argument('--out-dir', type=str, default=None,
+                        help='repaired xml directory, default None (in place)')
+    parser.add_argument('--out-json', type=str, default=None,
+                        help='output report json path, default None (print summary only)')
+    parser.add_argument('--processes', type=int, default=4,
+                        help='processes num for validation, default 4')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    validator = XmlValidator(args.xml_dir, args.img_dir, '.' + args.img_ext,
+                             args.mode, args.out_dir, args.processes)
+    t1 = time.time()
+    report = validator.run()
+    t2 = time.time()
+    if args.out_json:
+        validator.save_report(args.out_json)
+    logger.info(json.dumps(report['summary'], indent=2))
+    logger.info(f"finished in {t2-t1} seconds")
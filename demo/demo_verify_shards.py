@@ -0,0 +1,39 @@
+import sys
+sys.path.append('.')
+import json
+import logging
+import argparse
+from pathlib import Path
+from predet.utils.shard import verify_shards
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="verify a sharded run processed every input once")
+    parser.add_argument('input_dir', type=str,
+                        help='input directory of the job (images, xml or dota txt)')
+    parser.add_argument('out_dir', type=str,
+                        help='output directory containing shard manifests')
+    parser.add_argument('num_shards', type=int,
+                        help='total shard number')
+    parser.add_argument('--ext', type=str, default='xml',
+                        help='input extension, default xml')
+    parser.add_argument('--out-json', type=str, default=None,
+                        help='save verify result to json, default None')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    inputs = list(Path(args.input_dir).glob('*.' + args.ext))
+    result = verify_shards(args.out_dir, inputs, args.num_shards)
+    if args.out_json:
+        with open(args.out_json, 'w') as f:
+            json.dump(result, f, indent=2)
+    for key in ('missing_shards', 'missing', 'duplicated', 'unexpected'):
+        if result[key]:
+            logger.error(f"{len(result[key])} {key}: {result[key][:10]}")
+    logger.info(f"{len(inputs)} inputs, verify {'passed' if result['ok'] else 'failed'}")
+    sys.exit(0 if result['ok'] else 1)
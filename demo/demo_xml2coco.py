@@ -4,6 +4,7 @@ import time
 import argparse
 import logging
 from predet.dataset.xml2coco import Xml2Coco
+from predet.utils.profiler import Profiler
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -19,18 +20,31 @@ def parse_args():
                         help='class txt file')
     parser.add_argument('--img-ext', type=str, default='jpg',
                         help='image format, default jpg')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='xml parsing processes num with --pipeline, default 1')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='overlap xml reading and parsing')
+    parser.add_argument('--profile', type=str, default=None,
+                        help='save per-stage timing summary to this json path')
     return parser.parse_args()
 
 
 if __name__ == '__main__':
     args = parse_args()
+    profiler = Profiler() if args.profile else None
     xml_dir = args.xml_dir
     out_json = args.out_json
     cls_txt = args.cls_txt
     img_ext = '.' + args.img_ext
 
-    xml2coco = Xml2Coco(xml_dir, out_json, cls_txt, img_ext)
+    xml2coco = Xml2Coco(xml_dir, out_json, cls_txt, img_ext, profiler)
     t1 = time.time()
-    xml2coco.convert()
+    if args.pipeline:
+        xml2coco.convert_pipeline(workers=max(1, args.threads))
+    else:
+        xml2coco.convert()
     t2 = time.time()
-    logger.info(f"converted finished in {t2-t1} seconds")
\ No newline at end of file
+    logger.info(f"converted finished in {t2-t1} seconds")
+    if profiler:
+        profiler.to_json(args.profile)
+        logger.info(f"profile summary saved to {args.profile}")
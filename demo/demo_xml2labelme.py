@@ -4,6 +4,7 @@ import time
 import argparse
 import logging
 from predet.dataset.xml2labelme import Xml2labelme
+from predet.utils.profiler import Profiler
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -21,22 +22,43 @@ def parse_args():
                         help='threads num for multi-threads')
     parser.add_argument('--with_group', action='store_true',
                         help='add group_id info')
+    parser.add_argument('--num-shards', type=int, default=1,
+                        help='total shard number for distributed runs, default 1')
+    parser.add_argument('--shard-index', type=int, default=0,
+                        help='shard index of this run, default 0')
+    parser.add_argument('--shard-balance', action='store_true',
+                        help='balance shards by input size')
+    parser.add_argument('--resume', action='store_true',
+                        help='skip inputs finished by a previous --resume run')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='overlap reading, converting (threads num processes) and writing')
+    parser.add_argument('--profile', type=str, default=None,
+                        help='save per-stage timing summary to this json path')
     return parser.parse_args()
 
 
 if __name__ == '__main__':
     args = parse_args()
+    profiler = Profiler() if args.profile else None
     xml_dir = args.xml_dir
     out_dir = args.out_dir
     cls_txt = args.cls_txt
     with_group = args.with_group
 
-    xml2labelme = Xml2labelme(xml_dir, out_dir, cls_txt, with_group)
+    xml2labelme = Xml2labelme(xml_dir, out_dir, cls_txt, with_group,
+                              num_shards=args.num_shards, shard_index=args.shard_index,
+                              shard_balance=args.shard_balance, resume=args.resume,
+                              profiler=profiler)
     t1 = time.time()
     threads = max(1, args.threads)
-    if threads == 1:
+    if args.pipeline:
+        xml2labelme.convert_pipeline(workers=threads)
+    elif threads == 1:
         xml2labelme.convert()
     else:
         xml2labelme.convert_thread(threads)
     t2 = time.time()
-    logger.info(f"converted finished in {t2-t1} seconds")
\ No newline at end of file
+    logger.info(f"converted finished in {t2-t1} seconds")
+    if profiler:
+        profiler.to_json(args.profile)
+        logger.info(f"profile summary saved to {args.profile}")
@@ -0,0 +1,39 @@
+import sys
+sys.path.append('.')
+import time
+import json
+import logging
+import argparse
+from predet.dataset.xml_stats import XmlStatistics
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="xml annotations statistics")
+    parser.add_argument('xml_dir', type=str,
+                        help='xml directory')
+    parser.add_argument('--out-json', type=str, default=None,
+                        help='output statistics json path, default None (print only)')
+    parser.add_argument('--bins', type=int, default=20,
+                        help='histogram bin number, default 20')
+    parser.add_argument('--processes', type=int, default=4,
+                        help='processes num for xml parsing, default 4')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    stats = XmlStatistics(args.xml_dir, args.processes)
+    t1 = time.time()
+    stats.load()
+    report = stats.report(args.bins)
+    t2 = time.time()
+    if args.out_json:
+        stats.save_report(args.out_json, args.bins)
+    summary = {k: v for k, v in report.items()
+               if k in ('image_num', 'object_num', 'class_count', 'scale',
+                        'degenerate_num', 'out_of_bounds_num', 'unreadable_num')}
+    logger.info(json.dumps(summary, indent=2))
+    logger.info(f"finished in {t2-t1} seconds")
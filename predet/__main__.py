@@ -0,0 +1,4 @@
+import sys
+from predet.cli import main
+
+sys.exit(main())
@@ -0,0 +1,270 @@
+''' predet command line tool
+
+    python -m predet slice img xml tiles --slice-size 640 640 --workers 8
+    python -m predet xml2yolo xml labels classes.txt --num-shards 4 --shard-index 0
+    python -m predet run jobs.yaml --workers 16 --resume
+
+A job file (json, or yaml with PyYAML installed) lists many datasets. Job
+keys are the keyword arguments of the converter class of its task, keys at
+the top level are defaults for the jobs whose task accepts them (cls_txt
+below is used by xml2yolo but not by slice):
+
+    resume: true
+    cls_txt: classes.txt
+    jobs:
+      - task: xml2yolo
+        xml_dir: a/xml
+        out_dir: a/labels
+      - task: slice
+        img_dir: b/images
+        xml_dir: b/xml
+        out_dir: b/tiles
+        slice_size: [1024, 1024]
+
+All jobs run in this process one after another. With --workers > 1 they
+share a single process pool (the pipeline mode of each converter), so the
+interpreter and the workers start once for the whole job file.
+'''
+import sys
+import json
+import time
+import logging
+import argparse
+import importlib
+import importlib.util
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# task: (module, class, serial method, pipeline method, supports shard/resume)
+TASKS = {
+    'slice': ('predet.transform.image_slice', 'ImageSlice', 'run', 'run_pipeline', True),
+    'xml2coco': ('predet.dataset.xml2coco', 'Xml2Coco', 'convert', 'convert_pipeline', False),
+    'xml2yolo': ('predet.dataset.xml2yolo', 'Xml2Yolo', 'convert', 'convert_pipeline', True),
+    'xml2labelme': ('predet.dataset.xml2labelme', 'Xml2labelme', 'convert',
+                    'convert_pipeline', True),
+    'dota2xml': ('predet.dataset.dota2xml', 'Dota2Xml', 'convert', 'convert_pipeline', True),
+}
+# shared options, (option, default); None defaults on the command line mean
+# "not given", so job file values are kept
+COMMON = (('num_shards', 1), ('shard_index', 0), ('shard_balance', False), ('resume', False))
+
+
+def _add_common(parser: argparse.ArgumentParser):
+    parser.add_argument('--workers', type=int, default=None,
+                        help='compute processes shared by all jobs, 1 runs in the '
+                             'main process, default 1')
+    parser.add_argument('--num-shards', type=int, default=None,
+                        help='total shard number for distributed runs, default 1')
+    parser.add_argument('--shard-index', type=int, default=None,
+                        help='shard index of this run, default 0')
+    parser.add_argument('--shard-balance', action='store_true', default=None,
+                        help='balance shards by input size')
+    parser.add_argument('--resume', action='store_true', default=None,
+                        help='skip inputs finished by a previous --resume run')
+    parser.add_argument('--profile', type=str, default=None,
+                        help='save per-stage timing summary of each job to this json path')
+
+
+def parse_args(argv: List[str]=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='predet', description="pre-steps for object detection")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    p = subparsers.add_parser('run', help='run a json / yaml job file')
+    p.add_argument('job_file', type=str, help='job file path')
+    _add_common(p)
+
+    p = subparsers.add_parser('slice', help='slice images and xml annotations')
+    p.add_argument('img_dir', type=str, help='image directory')
+    p.add_argument('xml_dir', type=str, help='xml directory')
+    p.add_argument('out_dir', type=str, help='output tile and annotation directory')
+    p.add_argument('--slice-size', type=int, nargs=2, default=[640, 640],
+                   metavar=('W', 'H'), help='slice patch size, default 640 640')
+    p.add_argument('--overlap-ratio', type=float, nargs=2, default=[0.5, 0.5],
+                   metavar=('RW', 'RH'), help='slice patch overlap ratio, default 0.5 0.5')
+    p.add_argument('--min-area-ratio', type=float, default=0.2,
+                   help='min area ratio kept for objects cut by slices, default 0.2')
+    p.add_argument('--ext', type=str, default='jpg', help='image extension, default jpg')
+    p.add_argument('--out-format', type=str, default='xml', choices=('xml', 'coco'),
+                   help='tile annotations, one xml per tile or one coco json, default xml')
+    p.add_argument('--classes', type=str, default=None,
+                   help='class txt file, required by coco output')
+    p.add_argument('--coco-path', type=str, default=None,
+                   help='coco json save path, default annotations.json in out_dir')
+    _add_common(p)
+
+    p = subparsers.add_parser('xml2coco', help='xml to one coco json')
+    p.add_argument('xml_dir', type=str, help='xml directory')
+    p.add_argument('out_path', type=str, help='output coco json path')
+    p.add_argument('cls_txt', type=str, help='class txt file')
+    p.add_argument('--img-ext', type=str, default='.jpg', help='image extension, default .jpg')
+    _add_common(p)
+
+    p = subparsers.add_parser('xml2yolo', help='xml to yolo txt')
+    p.add_argument('xml_dir', type=str, help='xml directory')
+    p.add_argument('out_dir', type=str, help='output yolo txt directory')
+    p.add_argument('cls_txt', type=str, help='class txt file')
+    _add_common(p)
+
+    p = subparsers.add_parser('xml2labelme', help='xml to labelme json')
+    p.add_argument('xml_dir', type=str, help='xml directory')
+    p.add_argument('out_dir', type=str, help='output labelme json directory')
+    p.add_argument('cls_txt', type=str, help='class txt file')
+    p.add_argument('--with-group', action='store_true', help='add group_id info')
+    _add_common(p)
+
+    p = subparsers.add_parser('dota2xml', help='dota rect labels to xml')
+    p.add_argument('img_dir', type=str, help='dota image directory')
+    p.add_argument('txt_dir', type=str, help='dota rect label directory')
+    p.add_argument('out_dir', type=str, help='output xml directory')
+    p.add_argument('--with-difficult', action='store_true', help='keep difficult objects')
+    _add_common(p)
+    return parser.parse_args(argv)
+
+
+def load_jobs(job_file: str) -> Dict:
+    ''' read a json or yaml job file
+
+    Return:
+        [dict], {'jobs': [{'task': ..., kwargs}, ...], defaults}
+    '''
+    with open(job_file, 'r') as f:
+        if Path(job_file).suffix.lower() in ('.yaml', '.yml'):
+            if importlib.util.find_spec('yaml') is None:
+                raise ImportError("yaml job files require PyYAML, pip install pyyaml")
+            import yaml
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+    if isinstance(data, list):
+        data = dict(jobs=data)
+    if not isinstance(data, dict) or not isinstance(data.get('jobs'), list):
+        raise ValueError(f"{job_file}: a 'jobs' list is required")
+    for idx, job in enumerate(data['jobs']):
+        if not isinstance(job, dict) or job.get('task') not in TASKS:
+            raise ValueError(f"{job_file}: job {idx} needs a task in {list(TASKS)}")
+    return data
+
+
+def task_params(task: str) -> set:
+    ''' keyword arguments accepted by the converter class of task
+    '''
+    import inspect
+    module, cls_name = TASKS[task][:2]
+    cls = getattr(importlib.import_module(module), cls_name)
+    params = inspect.signature(cls).parameters
+    return {name for name, p in params.items()
+            if p.kind in (p.POSITIONAL_OR_KEYWORD, p.KEYWORD_ONLY)} - {'profiler'}
+
+
+def build_jobs(args: argparse.Namespace) -> Tuple[List[Dict], Dict]:
+    ''' jobs and global options, command line options override job values,
+    which override the job file defaults
+    '''
+    options = vars(args).copy()
+    command = options.pop('command')
+    cli = {key: options.pop(key) for key in ('workers', 'profile') + tuple(k for k, _ in COMMON)}
+    if command == 'run':
+        data = load_jobs(options.pop('job_file'))
+        jobs = data.pop('jobs')
+    else:
+        data, jobs = {}, [dict(task=command, **options)]
+
+    # workers and profile are global, one pool and one report for all jobs
+    settings = dict(workers=1, profile=None)
+    for key in settings:
+        value = data.pop(key, None)
+        if cli[key] is not None:
+            settings[key] = cli[key]
+        elif value is not None:
+            settings[key] = value
+
+    # file defaults only apply to the tasks accepting them, values set on the
+    # job or the command line are passed as is and checked by the task
+    unused = set(data)
+    merged = []
+    for job in jobs:
+        params = task_params(job['task'])
+        defaults = {key: value for key, value in data.items() if key in params}
+        unused -= set(defaults)
+        merged_job = dict(defaults, **job)
+        for key, _ in COMMON:
+            if cli[key] is not None:
+                merged_job[key] = cli[key]
+        merged.append(merged_job)
+    if unused:
+        raise ValueError(f"job file defaults {sorted(unused)} are not accepted by any job")
+    return merged, settings
+
+
+def run_job(job: Dict, executor=None, profiler=None) -> List:
+    ''' run one job, in the shared executor if given
+
+    Return:
+        failed: [list], inputs failed in pipeline mode
+    '''
+    job = dict(job)
+    task = job.pop('task')
+    module, cls_name, serial, pipeline, supported = TASKS[task]
+    if not supported:
+        for key, default in COMMON:
+            if job.pop(key, default) != default:
+                raise ValueError(f"{task} does not support {key}")
+    cls = getattr(importlib.import_module(module), cls_name)
+    obj = cls(profiler=profiler, **job)
+    if executor is None:
+        getattr(obj, serial)()
+        return []
+    return getattr(obj, pipeline)(executor=executor) or []
+
+
+def main(argv: List[str]=None) -> int:
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args(argv)
+    jobs, settings = build_jobs(args)
+    workers = max(1, settings['workers'])
+
+    executor = None
+    if workers > 1:
+        # imported here, concurrent.futures.process pulls in multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(workers)
+    profiles, failed_jobs, failed_num = [], [], 0
+    try:
+        for idx, job in enumerate(jobs):
+            profiler = None
+            if settings['profile']:
+                from .utils.profiler import Profiler
+                profiler = Profiler()
+            name = f"job {idx} ({job['task']})"
+            logger.info(f"{name} started with {workers} workers")
+            t1 = time.time()
+            try:
+                failed = run_job(job, executor, profiler)
+            except Exception as e:
+                logger.exception(f"{name} failed: {e}")
+                failed_jobs.append(idx)
+                continue
+            failed_num += len(failed)
+            logger.info(f"{name} finished in {time.time()-t1:.2f} seconds, "
+                        f"{len(failed)} inputs failed")
+            if profiler:
+                profiles.append(dict(job=job, profile=profiler.summary()))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if settings['profile']:
+        with open(settings['profile'], 'w') as f:
+            json.dump(profiles, f, indent=2)
+        logger.info(f"profile summary saved to {settings['profile']}")
+    if failed_jobs or failed_num:
+        logger.error(f"{len(failed_jobs)} of {len(jobs)} jobs failed {failed_jobs}, "
+                     f"{failed_num} inputs failed")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,111 @@
+from array import array
+from typing import List, Dict, Tuple, Iterator
+
+
+class ImageAnnotation(object):
+    ''' compact annotation record of one image
+
+    Boxes are kept in a flat number array and object names are indexed, so a
+    record holds two arrays instead of a list and a tuple per box:
+        names: [list], object names, in order of first appearance
+        cls_ids: [array], ('H'), index in names of each box
+        boxes: [array], ('i', or 'd' for sub-pixel sources such as COCO),
+               x1, y1, x2, y2 of each box, flattened
+
+    example:
+        ann = ImageAnnotation('0001.jpg', 1920, 1080)
+        ann.add('car', (10, 20, 110, 80))
+        for name, bboxes in ann.groups():
+            ...
+        img_info, obj_info = ann.to_legacy()  # XmlFormat.parse_xml_info format
+    '''
+    __slots__ = ('img_name', 'width', 'height', 'depth', 'names', 'cls_ids', 'boxes')
+
+    def __init__(self, img_name='', width=0, height=0, depth=3, typecode='i'):
+        '''
+        Args:
+            img_name: [str], image file name
+            width: [int], image width
+            height: [int], image height
+            depth: [int], image channels, default 3
+            typecode: [str], box array type, 'i' (int) or 'd' (float), default 'i'
+        '''
+        self.img_name = img_name
+        self.width = width
+        self.height = height
+        self.depth = depth
+        self.names = []
+        self.cls_ids = array('H')
+        self.boxes = array(typecode)
+
+    def __len__(self) -> int:
+        return len(self.cls_ids)
+
+    def __iter__(self) -> Iterator[Tuple[str, Tuple]]:
+        ''' iterate (name, (x1, y1, x2, y2)) in insertion order
+        '''
+        names, boxes = self.names, self.boxes
+        for i, cls_id in enumerate(self.cls_ids):
+            yield names[cls_id], tuple(boxes[4*i:4*i+4])
+
+    def __repr__(self) -> str:
+        return (f"ImageAnnotation({self.img_name!r}, {self.width}, {self.height}, "
+                f"{self.depth}, objects={len(self)})")
+
+    def add(self, name: str, box):
+        ''' append one box, coordinates are truncated to int for 'i' boxes
+
+        Args:
+            name: [str], object name
+            box: [list | tuple], x1, y1, x2, y2
+        '''
+        try:
+            cls_id = self.names.index(name)
+        except ValueError:
+            cls_id = len(self.names)
+            self.names.append(name)
+        self.cls_ids.append(cls_id)
+        if self.boxes.typecode == 'i':
+            self.boxes.extend((int(box[0]), int(box[1]), int(box[2]), int(box[3])))
+        else:
+            self.boxes.extend(box)
+
+    def box(self, idx: int) -> Tuple:
+        return tuple(self.boxes[4*idx:4*idx+4])
+
+    def groups(self) -> Iterator[Tuple[str, List[Tuple]]]:
+        ''' iterate (name, [box, ...]) grouped by name, same order as the
+        obj_info dict of XmlFormat.parse_xml_info
+        '''
+        grouped = [[] for _ in self.names]
+        boxes = self.boxes
+        for i, cls_id in enumerate(self.cls_ids):
+            grouped[cls_id].append(tuple(boxes[4*i:4*i+4]))
+        for name, bboxes in zip(self.names, grouped):
+            if bboxes:
+                yield name, bboxes
+
+    @property
+    def img_info(self) -> List:
+        ''' [img_name, W, H, C]
+        '''
+        return [self.img_name, self.width, self.height, self.depth]
+
+    def to_legacy(self) -> Tuple[List, Dict]:
+        ''' convert to (img_info, obj_info) of XmlFormat.parse_xml_info
+        '''
+        return self.img_info, dict(self.groups())
+
+    @classmethod
+    def from_legacy(cls, img_info: List, obj_info: Dict) -> 'ImageAnnotation':
+        ''' build a record from (img_info, obj_info) of XmlFormat.parse_xml_info
+
+        Args:
+            img_info: [list], [img_name, W, H, C], or None
+            obj_info: [dict], {obj_name: [[x1, y1, x2, y2], ...], ...}
+        '''
+        ann = cls(*img_info) if img_info is not None else cls()
+        for name, bboxes in obj_info.items():
+            for box in bboxes:
+                ann.add(name, box)
+        return ann
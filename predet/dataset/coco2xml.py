@@ -0,0 +1,198 @@
+import logging
+from pathlib import Path
+from functools import partial
+from typing import Callable, List
+from .xml_format import XmlFormat as Xml
+from .coco_format import CocoFormat
+from .annotation import ImageAnnotation
+from ..utils.shard import split_shards, write_manifest
+from ..utils.checkpoint import Journal, atomic_write, journal_path
+from ..utils.profiler import Profiler, NULL_PROFILER
+from ..utils.pipeline import Pipeline
+
+logger = logging.getLogger(__name__)
+
+
+def _coco_to_xml(ann: ImageAnnotation, out_path: str) -> bytes:
+    ''' dumps function of Coco2Xml
+    '''
+    return Xml.dumps_annotation(ann, out_path)
+
+
+def _dumps_payload(payload: tuple, dumps_fn: Callable) -> bytes:
+    ''' compute stage of _CocoConverter.convert_pipeline, runs in worker processes
+    '''
+    ann, out_path = payload
+    return dumps_fn(ann, out_path)
+
+
+class _CocoConverter(object):
+    ''' write one file per image of a coco json, see Coco2Xml and Coco2Yolo
+    '''
+    ext = ''
+    dump_stage = 'dump'
+
+    def __init__(self,
+                 json_path: str,
+                 out_dir: str,
+                 dumps_fn: Callable,
+                 stream=False,
+                 num_shards=1,
+                 shard_index=0,
+                 shard_balance=False,
+                 resume=False,
+                 profiler: Profiler=None):
+        '''
+        Args:
+            json_path: [str], coco json annotation path
+            out_dir: [str], output directory
+            dumps_fn: [callable], (ImageAnnotation, out path) -> file content,
+                      a module level function (or functools.partial of one),
+                      so it can be sent to worker processes
+            stream: [bool], parse the json incrementally with ijson (for 1 GB+
+                    files), default False
+            num_shards: [int], total shard number for distributed runs, default 1
+            shard_index: [int], index of the shard processed by this instance
+            shard_balance: [bool], balance shards by object number, default False
+            resume: [bool], skip images finished by a previous run, default False
+            profiler: [Profiler], collect per-stage timing, default None (disabled)
+        '''
+        assert Path(json_path).exists(), f"{json_path} not found!"
+        self.json_path = json_path
+        self.out_dir = Path(out_dir)
+        self.dumps_fn = dumps_fn
+        self.stream = stream
+        self.num_shards = num_shards
+        self.shard_index = shard_index
+        self.shard_balance = shard_balance
+        self.resume = resume
+        self.profiler = profiler if profiler is not None else NULL_PROFILER
+        self.coco = None
+
+    def _load(self) -> List[ImageAnnotation]:
+        ''' records of current shard
+        '''
+        with self.profiler.stage('json_load'):
+            self.coco = CocoFormat(self.json_path, self.stream).load()
+        if self.profiler.enabled:
+            self.profiler.add_bytes('json_load', Path(self.json_path).stat().st_size)
+        records = self.coco.records
+        weights = None
+        if self.num_shards > 1 and self.shard_balance:
+            weights = [len(ann) + 1 for ann in records]
+        return split_shards(records, self.num_shards, self.shard_index, weights)
+
+    def _out_path(self, ann: ImageAnnotation) -> Path:
+        return self.out_dir.joinpath(Path(ann.img_name).stem + self.ext)
+
+    def _convert_single(self, ann: ImageAnnotation):
+        prof = self.profiler
+        out_path = self._out_path(ann)
+        with prof.stage(self.dump_stage):
+            data = self.dumps_fn(ann, str(out_path))
+        with prof.stage('file_write'):
+            atomic_write(out_path, data)
+        prof.add_bytes('file_write', len(data))
+        prof.add('items')
+
+    def _open_journal(self) -> Journal:
+        return Journal(journal_path(self.out_dir, self.num_shards, self.shard_index),
+                       self.resume)
+
+    def _finish(self, done):
+        if self.num_shards > 1:
+            write_manifest(str(self.out_dir), self.num_shards, self.shard_index, done)
+
+    def convert(self):
+        from tqdm import tqdm
+        if not self.out_dir.exists():
+            self.out_dir.mkdir(parents=True)
+
+        records = self._load()
+        with self._open_journal() as journal:
+            for ann in tqdm([ann for ann in records if ann.img_name not in journal]):
+                self._convert_single(ann)
+                journal.add(ann.img_name)
+            self._finish(journal.done)
+
+    def convert_thread(self, threads=4):
+        ''' serialize and write in a thread pool, which mainly hides file
+        write latency
+        '''
+        from tqdm import tqdm
+        from multiprocessing.pool import ThreadPool
+        if not self.out_dir.exists():
+            self.out_dir.mkdir(parents=True)
+
+        records = self._load()
+        with self._open_journal() as journal:
+            todo = [ann for ann in records if ann.img_name not in journal]
+            chunksize = max(1, min(64, len(todo) // (threads * 16)))
+            with ThreadPool(threads) as p:
+                for ann, _ in zip(todo, tqdm(p.imap(self._convert_single, todo, chunksize),
+                                             total=len(todo))):
+                    journal.add(ann.img_name)
+            self._finish(journal.done)
+
+    def _payload(self, ann: ImageAnnotation) -> tuple:
+        return ann, str(self._out_path(ann))
+
+    def _write(self, ann: ImageAnnotation, data: bytes):
+        with self.profiler.stage('file_write'):
+            atomic_write(self._out_path(ann), data)
+        self.profiler.add_bytes('file_write', len(data))
+
+    def convert_pipeline(self, workers=2, writers=2, queue_size=256, executor=None):
+        ''' serialize in processes and write in threads, see utils.pipeline.Pipeline,
+        executor is an optional shared pool
+
+        Records are already in memory, so there is no read stage, each record
+        is sent to a worker with its output path.
+        '''
+        from tqdm import tqdm
+        if not self.out_dir.exists():
+            self.out_dir.mkdir(parents=True)
+
+        records = self._load()
+        pipeline = Pipeline(self._payload, partial(_dumps_payload, dumps_fn=self.dumps_fn),
+                            self._write, 1, workers, writers, queue_size,
+                            compute_batch=32, executor=executor)
+        with self._open_journal() as journal:
+            todo = [ann for ann in records if ann.img_name not in journal]
+
+            def on_done(anns):
+                journal.add_many([ann.img_name for ann in anns])
+
+            with tqdm(total=len(todo)) as progress:
+                failed = pipeline.run(todo, on_done, progress)
+            self._finish(journal.done)
+        return [ann.img_name for ann in failed]
+
+
+class Coco2Xml(_CocoConverter):
+    ''' coco json annotations to voc xml, one xml per image
+
+    example:
+        Coco2Xml('instances_train2017.json', 'xml', stream=True).convert_thread(8)
+    '''
+    ext = '.xml'
+    dump_stage = 'xml_dump'
+
+    def __init__(self,
+                 json_path: str,
+                 out_dir: str,
+                 stream=False,
+                 num_shards=1,
+                 shard_index=0,
+                 shard_balance=False,
+                 resume=False,
+                 profiler: Profiler=None):
+        '''
+        Args:
+            json_path: [str], coco json annotation path
+            out_dir: [str], xml save directory
+            others: see _CocoConverter
+        '''
+        super(Coco2Xml, self).__init__(json_path, out_dir, _coco_to_xml, stream, num_shards,
+                                       shard_index, shard_balance, resume, profiler)
+
@@ -0,0 +1,68 @@
+from pathlib import Path
+from functools import partial
+from typing import List, Union
+from .annotation import ImageAnnotation
+from .coco2xml import _CocoConverter
+from .xml2yolo import _yolo_rows
+from ..utils.profiler import Profiler
+
+
+def _coco_to_yolo(ann: ImageAnnotation, out_path: str, classes: List[str]) -> bytes:
+    ''' dumps function of Coco2Yolo
+    '''
+    return _yolo_rows(ann, classes)
+
+
+class Coco2Yolo(_CocoConverter):
+    ''' coco json annotations to yolo txt, one txt per image
+
+    example:
+        Coco2Yolo('instances_train2017.json', 'labels', stream=True).convert_thread(8)
+    '''
+    ext = '.txt'
+    dump_stage = 'convert'
+
+    def __init__(self,
+                 json_path: str,
+                 out_dir: str,
+                 cls_txt: Union[str, List]=None,
+                 stream=False,
+                 num_shards=1,
+                 shard_index=0,
+                 shard_balance=False,
+                 resume=False,
+                 profiler: Profiler=None):
+        '''
+        Args:
+            json_path: [str], coco json annotation path
+            out_dir: [str], yolo txt save directory
+            cls_txt: [str | list], class list or class file, classes not in it
+                     are ignored, default None (coco categories in id order)
+            others: see coco2xml._CocoConverter
+        '''
+        if isinstance(cls_txt, str):
+            assert Path(cls_txt).exists(), f"{cls_txt} not found!"
+            self.classes = self._load_classes(cls_txt)
+        else:
+            assert cls_txt is None or isinstance(cls_txt, (list, tuple))
+            self.classes = cls_txt
+        super(Coco2Yolo, self).__init__(json_path, out_dir, self._dumps_fn(), stream,
+                                        num_shards, shard_index, shard_balance, resume,
+                                        profiler)
+
+    def _load_classes(self, cls_txt: str, ignore='#') -> List[str]:
+        ''' load classes info from file
+        '''
+        with open(cls_txt, 'r') as f:
+            return [line.strip() for line in f.readlines()
+                if not line.startswith(ignore)]
+
+    def _load(self) -> List[ImageAnnotation]:
+        records = super(Coco2Yolo, self)._load()
+        if self.classes is None:
+            self.classes = self.coco.classes
+            self.dumps_fn = self._dumps_fn()
+        return records
+
+    def _dumps_fn(self):
+        return partial(_coco_to_yolo, classes=list(self.classes or []))
@@ -0,0 +1,221 @@
+import json
+import shutil
+import logging
+import tempfile
+import threading
+import importlib.util
+from pathlib import Path
+from typing import List, Iterator
+from .annotation import ImageAnnotation
+from ..utils.checkpoint import atomic_path
+
+logger = logging.getLogger(__name__)
+
+
+class CocoFormat(object):
+    ''' coco json annotations reader
+
+    Annotations are grouped by image_id in a single pass into one
+    ImageAnnotation per image (float boxes, x1, y1, x2, y2), in the order
+    of the 'images' list. Images without annotations are kept.
+
+    With stream=True the json is parsed incrementally with ijson, one pass
+    per section ('categories', 'images', 'annotations'), so only the grouped
+    records are held in memory. Use it for 1 GB+ annotation files.
+
+    example:
+        coco = CocoFormat('instances_train2017.json', stream=True).load()
+        for ann in coco:
+            ...
+    '''
+
+    def __init__(self, json_path: str, stream=False, with_crowd=False):
+        '''
+        Args:
+            json_path: [str], coco json annotation path
+            stream: [bool], parse with ijson instead of loading the whole json,
+                    default False
+            with_crowd: [bool], keep iscrowd annotations, default False
+        '''
+        assert Path(json_path).exists(), f"{json_path} not found!"
+        if stream:
+            assert importlib.util.find_spec('ijson') is not None, \
+                "stream parsing requires ijson, pip install ijson"
+        self.json_path = json_path
+        self.stream = stream
+        self.with_crowd = with_crowd
+
+        self.classes = []  # category names in category id order
+        self.records = []  # ImageAnnotation per image
+        self.missing_image_num = 0
+        self.missing_category_num = 0
+
+    def _sections(self):
+        ''' (categories, images, annotations) iterables
+        '''
+        if self.stream:
+            import ijson
+
+            def items(prefix):
+                with open(self.json_path, 'rb') as f:
+                    yield from ijson.items(f, prefix + '.item', use_float=True)
+            return items('categories'), items('images'), items('annotations')
+
+        with open(self.json_path, 'rb') as f:
+            data = json.load(f)
+        return data.get('categories', []), data.get('images', []), \
+            data.get('annotations', [])
+
+    def load(self) -> 'CocoFormat':
+        ''' parse categories, images and annotations, group annotations by image
+        '''
+        categories, images, annotations = self._sections()
+        cat_names = {}
+        for cat in categories:
+            cat_names[cat['id']] = cat['name']
+        self.classes = [cat_names[cat_id] for cat_id in sorted(cat_names)]
+
+        img_index = {}
+        for img in images:
+            img_index[img['id']] = len(self.records)
+            self.records.append(ImageAnnotation(Path(img['file_name']).name,
+                                                img['width'], img['height'], typecode='d'))
+
+        missing, missing_cat = 0, 0
+        records, with_crowd = self.records, self.with_crowd
+        for obj in annotations:
+            if obj.get('iscrowd', 0) and not with_crowd:
+                continue
+            idx = img_index.get(obj['image_id'])
+            if idx is None:
+                missing += 1
+                continue
+            name = cat_names.get(obj['category_id'])
+            if name is None:
+                missing_cat += 1
+                continue
+            x, y, w, h = obj['bbox']
+            records[idx].add(name, (x, y, x+w, y+h))
+        self.missing_image_num = missing
+        self.missing_category_num = missing_cat
+        if missing:
+            logger.warning(f"{missing} annotations refer to unknown image ids, ignored")
+        if missing_cat:
+            logger.warning(f"{missing_cat} annotations refer to unknown category ids, ignored")
+        logger.info(f"{len(self.records)} images, "
+                    f"{sum(len(ann) for ann in self.records)} objects, "
+                    f"{len(self.classes)} classes loaded")
+        return self
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self) -> Iterator[ImageAnnotation]:
+        return iter(self.records)
+
+
+class CocoWriter(object):
+    ''' streaming coco json writer
+
+    Images and annotations are serialized as they are added into two
+    temporary files next to out_path, and joined into out_path (atomically)
+    on close, so memory does not grow with the dataset. Image and annotation
+    ids are assigned in call order, boxes of classes not in `classes` are
+    ignored. Thread safe. Used as a context manager, nothing is written if
+    the block raises.
+
+    example:
+        with CocoWriter('annotations.json', ['car', 'person']) as coco:
+            coco.add_image(ann, parent_id=1, offset=[0, 0])
+    '''
+
+    def __init__(self, out_path: str, classes: List[str]):
+        '''
+        Args:
+            out_path: [str], coco json save path
+            classes: [list], class names, category id is index + 1
+        '''
+        self.out_path = Path(out_path)
+        assert self.out_path.suffix == '.json', \
+            "output coco annotations must be in json format!"
+        self.classes = list(classes)
+        self.cls_ids = {}
+        for idx, cls_name in enumerate(self.classes):
+            self.cls_ids.setdefault(cls_name, idx + 1)
+        tmp_dir = self.out_path.parent
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        self._images = tempfile.TemporaryFile('w+', dir=tmp_dir, suffix='.images')
+        self._annotations = tempfile.TemporaryFile('w+', dir=tmp_dir, suffix='.annotations')
+        self._lock = threading.Lock()
+        self.img_num = 0
+        self.obj_num = 0
+
+    def add_image(self, ann: ImageAnnotation, **extra) -> int:
+        ''' add one image with its boxes
+
+        Args:
+            ann: [ImageAnnotation], image name, size and boxes
+            extra: additional image fields, e.g. parent_id, offset
+
+        Return:
+            [int], image id
+        '''
+        with self._lock:
+            self.img_num += 1
+            img_id = self.img_num
+            image = dict(height=int(ann.height), width=int(ann.width), id=img_id,
+                         file_name=Path(ann.img_name).name, **extra)
+            self._images.write((',\n' if img_id > 1 else '') + json.dumps(image))
+            rows = []
+            for name, bboxes in ann.groups():
+                cls_id = self.cls_ids.get(name)
+                if cls_id is None:
+                    continue
+                for x1, y1, x2, y2 in bboxes:
+                    self.obj_num += 1
+                    rows.append(json.dumps(dict(
+                        segmentation=[], iscrowd=0, image_id=img_id,
+                        bbox=[x1, y1, x2-x1, y2-y1], area=(x2-x1) * (y2-y1),
+                        category_id=cls_id, id=self.obj_num)))
+            if rows:
+                prefix = ',\n' if self.obj_num > len(rows) else ''
+                self._annotations.write(prefix + ',\n'.join(rows))
+        return img_id
+
+    def close(self):
+        ''' write out_path and remove the temporary files
+        '''
+        with self._lock:
+            if self._images.closed:
+                return
+            categories = [dict(supercategory='Unspecified', id=idx + 1, name=cls_name)
+                          for idx, cls_name in enumerate(self.classes)]
+            with atomic_path(self.out_path) as tmp_path:
+                with open(tmp_path, 'w') as f:
+                    f.write('{"images": [\n')
+                    self._images.seek(0)
+                    shutil.copyfileobj(self._images, f)
+                    f.write('\n],\n"categories": ' + json.dumps(categories))
+                    f.write(',\n"annotations": [\n')
+                    self._annotations.seek(0)
+                    shutil.copyfileobj(self._annotations, f)
+                    f.write('\n]}\n')
+            self._images.close()
+            self._annotations.close()
+
+    def discard(self):
+        ''' remove the temporary files without writing out_path
+        '''
+        with self._lock:
+            self._images.close()
+            self._annotations.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        # a failed or interrupted run must not publish a partial json
+        if exc_type is not None:
+            self.discard()
+        else:
+            self.close()
@@ -0,0 +1,89 @@
+import json
+import logging
+from pathlib import Path
+from typing import List, Tuple, Dict
+from ..utils.file_io import get_file_path, find_duplicate_files, HashCache
+
+logger = logging.getLogger(__name__)
+
+
+class DatasetDedup(object):
+    ''' find duplicate images (by content) among xml + image datasets
+
+    example:
+        dedup = DatasetDedup([('train/images', 'train/xml'),
+                              ('val/images', 'val/xml')])
+        groups = dedup.find()
+        dedup.save_report('dup.json')
+    '''
+
+    def __init__(self,
+                 datasets: List[Tuple[str, str]],
+                 img_ext=('.jpg', '.png'),
+                 workers=8,
+                 cache_path: str=None):
+        '''
+        Args:
+            datasets: [list], [(img_dir, xml_dir), ...], xml_dir can be None
+            img_ext: [tuple], image extensions to search (recursive)
+            workers: [int], hash threads
+            cache_path: [str], sqlite hash cache path, default None (no cache)
+        '''
+        self.datasets = []
+        for img_dir, xml_dir in datasets:
+            assert Path(img_dir).exists(), f"{img_dir} not found!"
+            self.datasets.append((Path(img_dir), Path(xml_dir) if xml_dir else None))
+        self.img_ext = list(img_ext)
+        self.workers = workers
+        self.cache_path = cache_path
+        self.groups = []
+
+    def _find_xml(self, img_path: str, dataset_idx: int):
+        img_dir, xml_dir = self.datasets[dataset_idx]
+        if xml_dir is None:
+            return None
+        rel = Path(img_path).relative_to(img_dir).with_suffix('.xml')
+        xml_path = xml_dir.joinpath(rel)
+        if not xml_path.exists():
+            xml_path = xml_dir.joinpath(rel.name)
+        return str(xml_path) if xml_path.exists() else None
+
+    def find(self) -> List[Dict]:
+        ''' find duplicate image groups
+
+        Return:
+            groups: [list], [{'hash': str, 'cross_dataset': bool,
+                              'items': [{'dataset': idx, 'image': path, 'xml': path}, ...]},
+                             ...]
+        '''
+        path_list, owner = [], {}
+        for idx, (img_dir, _) in enumerate(self.datasets):
+            img_list = get_file_path(str(img_dir), self.img_ext, workers=self.workers)
+            logger.info(f"{len(img_list)} images found in {img_dir}")
+            for p in img_list:
+                owner[p] = idx
+            path_list.extend(img_list)
+
+        if self.cache_path:
+            with HashCache(self.cache_path) as cache:
+                duplicates = find_duplicate_files(path_list, workers=self.workers, cache=cache)
+        else:
+            duplicates = find_duplicate_files(path_list, workers=self.workers)
+
+        self.groups = []
+        for digest, group in duplicates.items():
+            items = [dict(dataset=owner[p], image=p, xml=self._find_xml(p, owner[p]))
+                     for p in group]
+            cross = len(set(item['dataset'] for item in items)) > 1
+            self.groups.append(dict(hash=digest, cross_dataset=cross, items=items))
+        logger.info(f"{len(self.groups)} duplicate groups found, "
+                    f"{sum(g['cross_dataset'] for g in self.groups)} across datasets")
+        return self.groups
+
+    def save_report(self, out_path: str):
+        ''' save duplicate groups to json
+        '''
+        report = dict(datasets=[[str(i), str(x) if x else None] for i, x in self.datasets],
+                      groups=self.groups)
+        with open(out_path, 'w') as f:
+            json.dump(report, f, indent=2)
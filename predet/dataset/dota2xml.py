@@ -1,14 +1,45 @@
-import sys
-sys.path.append('.')
 import logging
-import numpy as np
-from PIL import Image
 from pathlib import Path
-from tqdm import tqdm
+from functools import partial
 from .xml_format import XmlFormat
+from .annotation import ImageAnnotation
+from ..utils.shard import split_shards, write_manifest
+from ..utils.checkpoint import Journal, atomic_write, journal_path
+from ..utils.profiler import Profiler, NULL_PROFILER
+from ..utils.pipeline import Pipeline
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO)
+
+
+def _parse_dota_rows(row_list: list, img_info: list, with_difficult=True) -> ImageAnnotation:
+    ''' parse dota rect label rows into an annotation record
+
+    Args:
+        row_list: [list], lines of the dota label file
+        img_info: [list], [img_name, W, H, C]
+    '''
+    ann = ImageAnnotation(*img_info)
+    for row in row_list:
+        row = row.strip().split(' ')
+        if len(row) != 10:
+            continue
+        if (not with_difficult) and (int(row[-1]) == 1):
+            continue
+        polys = list(map(float, row[:8]))
+        xs, ys = polys[0::2], polys[1::2]
+        ann.add(row[8], (min(xs), min(ys), max(xs), max(ys)))
+    return ann
+
+
+def _dota_to_xml(payload: tuple, with_difficult=True) -> bytes:
+    ''' compute stage of Dota2Xml.convert_pipeline, runs in worker processes
+
+    Args:
+        payload: [tuple], (img_info, txt content, output xml path)
+    '''
+    img_info, data, out_path = payload
+    ann = _parse_dota_rows(data.decode('utf-8').splitlines(), img_info, with_difficult)
+    return XmlFormat.dumps_annotation(ann, out_path)
 
 
 class Dota2Xml(object):
@@ -32,55 +63,128 @@ class Dota2Xml(object):
     ...
     '''
 
-    def __init__(self, img_dir: str, txt_dir: str, out_dir: str, with_difficult=True):
+    def __init__(self, img_dir: str, txt_dir: str, out_dir: str, with_difficult=True,
+                 num_shards=1, shard_index=0, shard_balance=False, resume=False,
+                 profiler: Profiler=None):
+        '''
+        Args:
+            img_dir: [str], dota image directory
+            txt_dir: [str], dota rect label directory
+            out_dir: [str], output xml directory
+            with_difficult: [bool], keep difficult objects
+            num_shards: [int], total shard number for distributed runs, default 1
+            shard_index: [int], index of the shard processed by this instance
+            shard_balance: [bool], balance shards by label file size, default False
+            resume: [bool], skip label files finished by a previous run, default False
+            profiler: [Profiler], collect per-stage timing, default None (disabled)
+        '''
         self.img_dir = Path(img_dir)
         self.txt_dir = Path(txt_dir)
         assert self.img_dir.exists() and self.txt_dir.exists(), \
             "image dir or txt dir not found!"
 
         self.txt_list = sorted(list(self.txt_dir.glob('*.txt')))
+        self.num_shards = num_shards
+        self.shard_index = shard_index
+        if num_shards > 1:
+            weights = [p.stat().st_size for p in self.txt_list] if shard_balance else None
+            self.txt_list = split_shards(self.txt_list, num_shards, shard_index, weights)
         self.out_dir = Path(out_dir)
         if not self.out_dir.exists():
             self.out_dir.mkdir(parents=True)
         self.with_difficult = with_difficult
+        self.resume = resume
+        self.profiler = profiler if profiler is not None else NULL_PROFILER
         
     def _convert_single(self, txt_path: Path):
+        from PIL import Image
         img_path = self.img_dir.joinpath(txt_path.stem + '.png')
         if not img_path.exists():
-            logging.warning(f"{img_path} not found, ignore ...")
+            logger.warning(f"{img_path} not found, ignore ...")
             return False
         
+        prof = self.profiler
         out_path = self.out_dir.joinpath(txt_path.stem + '.xml')
-        img_w, img_h = Image.open(img_path).size
+        with prof.stage('img_header'):
+            img_w, img_h = Image.open(img_path).size
         img_info = [img_path.name, img_w, img_h, 3]
-        obj_info = {}
-        with txt_path.open('r') as f:
-            row_list = f.readlines()
-        for row in row_list:
-            row = row.strip().split(' ')
-            if len(row) != 10:
-                continue
-            if (not self.with_difficult) and (int(row[-1]) == 1):
-                continue
-            obj_name = row[8]
-            polys = np.array(list(map(float, row[:8]))).reshape(4, 2)
-            x1, y1 = polys.min(axis=0)
-            x2, y2 = polys.max(axis=0) 
-            if obj_name not in obj_info.keys():
-                obj_info[obj_name] = []
-            obj_info[obj_name].append([x1, y1, x2, y2])
-        XmlFormat.dump_xml(img_info, obj_info, str(out_path))
+        with prof.stage('txt_parse'):
+            with txt_path.open('r') as f:
+                row_list = f.readlines()
+            ann = _parse_dota_rows(row_list, img_info, self.with_difficult)
+        if prof.enabled:
+            prof.add_bytes('file_read', txt_path.stat().st_size)
+        with prof.stage('xml_dump'):
+            data = XmlFormat.dumps_annotation(ann, str(out_path))
+        with prof.stage('file_write'):
+            atomic_write(out_path, data)
+        prof.add_bytes('file_write', len(data))
+        prof.add('items')
         return True
 
+    def _open_journal(self) -> Journal:
+        return Journal(journal_path(self.out_dir, self.num_shards, self.shard_index),
+                       self.resume)
+
+    def _finish(self, done):
+        if self.num_shards > 1:
+            write_manifest(str(self.out_dir), self.num_shards, self.shard_index, done)
+
     def convert(self):
-        for txt_path in tqdm(self.txt_list):
-            try:
-                self._convert_single(txt_path)
-            except Exception as e:
-                logger.error(e)
+        from tqdm import tqdm
+        with self._open_journal() as journal:
+            for txt_path in tqdm(journal.todo(self.txt_list)):
+                try:
+                    if self._convert_single(txt_path):
+                        journal.add(txt_path)
+                except Exception as e:
+                    logger.error(e)
+            self._finish(journal.done)
 
     def convert_threads(self, threads=4):
+        from tqdm import tqdm
         from multiprocessing.pool import ThreadPool
-        with ThreadPool(threads) as p:
-           return list(tqdm(p.imap(self._convert_single, self.txt_list), total=len(self.txt_list))) 
+        with self._open_journal() as journal:
+            txt_list = journal.todo(self.txt_list)
+            results = []
+            with ThreadPool(threads) as p:
+                for txt_path, result in zip(txt_list, tqdm(
+                        p.imap(self._convert_single, txt_list), total=len(txt_list))):
+                    if result:
+                        journal.add(txt_path)
+                    results.append(result)
+            self._finish(journal.done)
+        return results
+
+    def _read(self, txt_path: Path) -> tuple:
+        from PIL import Image
+        img_path = self.img_dir.joinpath(txt_path.stem + '.png')
+        if not img_path.exists():
+            raise FileNotFoundError(f"{img_path} not found, ignore ...")
+        with self.profiler.stage('file_read'):
+            with Image.open(img_path) as img:
+                img_w, img_h = img.size
+            data = txt_path.read_bytes()
+        out_path = str(self.out_dir.joinpath(txt_path.stem + '.xml'))
+        return [img_path.name, img_w, img_h, 3], data, out_path
+
+    def _write(self, txt_path: Path, data: bytes):
+        with self.profiler.stage('file_write'):
+            atomic_write(self.out_dir.joinpath(txt_path.stem + '.xml'), data)
+        self.profiler.add_bytes('file_write', len(data))
 
+    def convert_pipeline(self, readers=4, workers=2, writers=2, queue_size=64,
+                         executor=None):
+        ''' overlap label reading, converting (in processes) and writing,
+        see utils.pipeline.Pipeline, executor is an optional shared pool
+        '''
+        from tqdm import tqdm
+        compute_fn = partial(_dota_to_xml, with_difficult=self.with_difficult)
+        pipeline = Pipeline(self._read, compute_fn, self._write,
+                            readers, workers, writers, queue_size, executor=executor)
+        with self._open_journal() as journal:
+            txt_list = journal.todo(self.txt_list)
+            with tqdm(total=len(txt_list)) as progress:
+                failed = pipeline.run(txt_list, journal.add_many, progress)
+            self._finish(journal.done)
+        return failed
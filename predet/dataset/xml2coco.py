@@ -1,17 +1,19 @@
 import json
 import logging
-import numpy as np
-from tqdm import tqdm
 from pathlib import Path
 from typing import List, Dict, Union
 from .xml_format import XmlFormat as Xml
+from .annotation import ImageAnnotation
+from ..utils.checkpoint import atomic_path
+from ..utils.profiler import Profiler, NULL_PROFILER
+from ..utils.pipeline import Pipeline
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO)
 
 
 class MyEncoder(json.JSONEncoder):
     def default(self, obj):
+        import numpy as np
         if isinstance(obj, np.integer):
             return int(obj)
         elif isinstance(obj, np.floating):
@@ -30,13 +32,15 @@ class Xml2Coco(object):
                  xml_dir: str,
                  out_path: str,
                  cls_txt: Union[str, List],
-                 img_ext='.jpg'):
+                 img_ext='.jpg',
+                 profiler: Profiler=None):
         '''
         Args:
             xml_dir: [str], xml annotation directory
             out_path: [str], COCO json format save path
             cls_txt: [str | list], class list or class file
             img_ext: [str], img format, default '.jpg'
+            profiler: [Profiler], collect per-stage timing, default None (disabled)
         '''
         super(Xml2Coco, self).__init__()
         self.xml_dir = xml_dir
@@ -51,6 +55,10 @@ class Xml2Coco(object):
             assert isinstance(cls_txt, (list, tuple))
             self.classes = cls_txt
         self.img_ext = img_ext
+        self.cls_ids = {}
+        for idx, cls_name in enumerate(self.classes):
+            self.cls_ids.setdefault(cls_name, idx)
+        self.profiler = profiler if profiler is not None else NULL_PROFILER
 
         self.img_list = []
         self.images = []
@@ -69,41 +77,43 @@ class Xml2Coco(object):
             return [line.strip() for line in f.readlines()
                 if not line.startswith(ignore)]
 
-    def _image(self, img_info: List, num: int) -> Dict:
+    def _image(self, ann: ImageAnnotation, num: int) -> Dict:
         '''generate 'image' info in coco json format
 
         Args:
-            img_info: [list], [img_name, w, h, c]
+            ann: [ImageAnnotation], annotation record of the image
             num: current image idx (start from 1)
 
         Return:
             image: [dict], dict with height, width, id, file_name
         '''
         image = {}
-        width = int(img_info[1])
-        height = int(img_info[2])
+        width = int(ann.width)
+        height = int(ann.height)
         image['height'] = height
         image['width'] = width
         image['id'] = num + 1
-        image['file_name'] = Path(img_info[0]).name
+        image['file_name'] = Path(ann.img_name).name
         self.height = height
         self.width = width
         return image
 
-    def _annotation(self, obj, img_name) -> Dict:
+    def _annotation(self, cls_name: str, box, img_id: int) -> Dict:
         '''generate 'annotation' info in coco json format
 
         Args:
-            obj: [list], [cls_name, xmin, ymin, w, h]
-            img_name: [str], image name corresponding to current obj
+            cls_name: [str], class name of current obj
+            box: [tuple], (xmin, ymin, xmax, ymax)
+            img_id: [int], id of the image corresponding to current obj
         '''
+        xmin, ymin, xmax, ymax = box
         annotation = {}
         annotation['segmentation'] = []
         annotation['iscrowd'] = 0
-        annotation['image_id'] = self.img_list.index(img_name) + 1
-        annotation['bbox'] = obj[1:]
-        annotation['area'] = obj[3] * obj[4]
-        annotation['category_id'] = self.classes.index(obj[0]) + 1
+        annotation['image_id'] = img_id
+        annotation['bbox'] = [xmin, ymin, xmax-xmin, ymax-ymin]
+        annotation['area'] = (xmax-xmin) * (ymax-ymin)
+        annotation['category_id'] = self.cls_ids[cls_name] + 1
         annotation['id'] = self.obj_num
         return annotation
 
@@ -119,36 +129,96 @@ class Xml2Coco(object):
             categories.append(categorie)
         return categories
 
+    def _add_xml(self, num: int, xml_path: str, ann: ImageAnnotation):
+        '''add image and annotations of one parsed xml
+        '''
+        img_name = Path(xml_path).stem + self.img_ext
+        self.img_list.append(img_name)
+        ann.img_name = img_name # 使用xml对应的文件名
+        self.images.append(self._image(ann, num))
+        for label, bbox in ann.groups():
+            if label not in self.cls_ids:
+                continue
+            for box in bbox:
+                self.obj_num += 1
+                self.annotations.append(self._annotation(label, box, num + 1))
+
     def _data_transfer(self):
         '''load xml annotations info
         '''
-        for num, xml_path in enumerate(tqdm(Xml.get_xml_list(self.xml_dir))):
-            img_name = Path(xml_path).stem + self.img_ext
-            self.img_list.append(img_name)
-            img_info, obj_info = Xml.parse_xml_info(xml_path)
-            img_info[0] = img_name # 使用xml对应的文件名
-            self.images.append(self._image(img_info, num))
-            for label, bbox in obj_info.items():
-                if label not in self.classes:
-                    continue
-                for box in bbox:
-                    self.obj_num += 1
-                    obj = list(box[:2]) + [box[2]-box[0],box[3]-box[1]]
-                    obj.insert(0, label)
-                    self.annotations.append(self._annotation(obj, img_name))
+        from tqdm import tqdm
+        for num, xml_path in enumerate(tqdm(Xml.iter_xml_list(self.xml_dir))):
+            with self.profiler.stage('xml_parse'):
+                ann = Xml.parse_annotation(xml_path)
+            if self.profiler.enabled:
+                self.profiler.add_bytes('file_read', Path(xml_path).stat().st_size)
+            self.profiler.add('items')
+            self._add_xml(num, xml_path, ann)
+
+    def _read(self, xml_path: str) -> bytes:
+        with self.profiler.stage('file_read'):
+            data = Path(xml_path).read_bytes()
+        self.profiler.add_bytes('file_read', len(data))
+        return data
+
+    def _data_transfer_pipeline(self, readers=4, workers=2, queue_size=64, executor=None):
+        '''load xml annotations info, reading in threads and parsing in processes
 
-    def convert(self):
-        ''' run convert process
+        Return:
+            failed: [list], xml paths failed to read or parse
         '''
-        logger.info("loading xml annotations ...")
-        self._data_transfer()
-
+        from tqdm import tqdm
+        parsed = {}
+
+        def read(item):
+            return self._read(item[1])
+
+        def collect(item, ann):
+            parsed[item] = ann
+
+        # items are (listing index, xml path), parsing starts while listing
+        pipeline = Pipeline(read, Xml.parse_annotation_bytes, collect,
+                            readers, workers, 1, queue_size, executor=executor)
+        with tqdm() as progress:
+            failed = pipeline.run(enumerate(Xml.iter_xml_list(self.xml_dir)),
+                                  progress=progress)
+        failed = [xml_path for _, xml_path in failed]
+        if failed:
+            logger.warning(f"{len(failed)} xml failed and are not in the coco json")
+        # keep image ids in listing order, as _data_transfer does
+        for num, xml_path in sorted(parsed):
+            self._add_xml(num, xml_path, parsed[(num, xml_path)])
+        return failed
+
+    def _save(self):
         logger.info("saving coco annotations ...")
         data_coco = {}
         data_coco['images'] = self.images
         data_coco['categories'] = self.categories
         data_coco['annotations'] = self.annotations
-        with open(self.out_path, 'w') as f:
-            json.dump(data_coco, f, indent=4, cls=MyEncoder)
+        # json is streamed to file, so json_dump includes the file write
+        Path(self.out_path).parent.mkdir(parents=True, exist_ok=True)
+        with self.profiler.stage('json_dump'):
+            with atomic_path(self.out_path) as tmp_path:
+                with open(tmp_path, 'w') as f:
+                    json.dump(data_coco, f, indent=4, cls=MyEncoder)
+        if self.profiler.enabled:
+            self.profiler.add_bytes('json_dump', Path(self.out_path).stat().st_size)
 
         logger.info("convert finished.")
+
+    def convert(self):
+        ''' run convert process
+        '''
+        logger.info("loading xml annotations ...")
+        self._data_transfer()
+        self._save()
+
+    def convert_pipeline(self, readers=4, workers=2, queue_size=64, executor=None):
+        ''' run convert process, overlapping xml reading and parsing,
+        see utils.pipeline.Pipeline, executor is an optional shared pool
+        '''
+        logger.info("loading xml annotations ...")
+        failed = self._data_transfer_pipeline(readers, workers, queue_size, executor)
+        self._save()
+        return failed
@@ -1,22 +1,19 @@
 import json
-import numpy as np
 from pathlib import Path
-from tqdm import tqdm
+from functools import partial
 from typing import List, Union
 from .xml_format import XmlFormat as Xml
+from .annotation import ImageAnnotation
+from ..utils.shard import split_shards, write_manifest
+from ..utils.checkpoint import Journal, atomic_write, journal_path
+from ..utils.profiler import Profiler, NULL_PROFILER
+from ..utils.pipeline import Pipeline
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-class MyEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, np.integer):
-            return int(obj)
-        elif isinstance(obj, np.floating):
-            return float(obj)
-        elif isinstance(obj, np.ndarray):
-            return obj.tolist()
-        else:
-            return super(MyEncoder, self).default(obj)
-        
 
 class Xml2labelme(object):
     ''' xml format to labelme json format
@@ -25,7 +22,28 @@ class Xml2labelme(object):
                  xml_dir: str,
                  out_dir: str,
                  cls_txt: Union[str, List],
-                 with_group=False):
+                 with_group=False,
+                 indent=None,
+                 num_shards=1,
+                 shard_index=0,
+                 shard_balance=False,
+                 resume=False,
+                 profiler: Profiler=None):
+        '''
+        Args:
+            xml_dir: [str], xml annotation directory
+            out_dir: [str], labelme json save directory
+            cls_txt: [str | list], class list or class file
+            with_group: [bool], add group_id to each shape
+            indent: [int], json indent, default None (compact output).
+                    orjson is used for compact output if installed.
+            num_shards: [int], total shard number for distributed runs, default 1
+            shard_index: [int], index of the shard processed by this instance
+            shard_balance: [bool], balance shards by xml file size, default False
+            resume: [bool], skip xml files finished by a previous run, default False
+            profiler: [Profiler], collect per-stage timing, default None (disabled),
+                      stages run by convert_process are not collected
+        '''
         super(Xml2labelme, self).__init__()
         self.xml = Xml(xml_dir)
         self.xml_dir = Path(xml_dir)
@@ -39,6 +57,12 @@ class Xml2labelme(object):
             assert isinstance(cls_txt, (list, tuple))
             self.classes = cls_txt
         self.with_group = with_group
+        self.indent = indent
+        self.num_shards = num_shards
+        self.shard_index = shard_index
+        self.shard_balance = shard_balance
+        self.resume = resume
+        self.profiler = profiler if profiler is not None else NULL_PROFILER
 
     def _load_classes(self, cls_txt: str, ignore='#') -> List[str]:
         ''' load classes info from file
@@ -47,49 +71,177 @@ class Xml2labelme(object):
             return [line.strip() for line in f.readlines()
                 if not line.startswith(ignore)]
 
-    def _init_json(self) -> dict:
+    @staticmethod
+    def _init_json() -> dict:
         data = {}
         data['version'] = '5.1.1'
         data['flags'] = {}
         data['shapes'] = []
         data['imageData'] = None
         return data
-    
-    def _convert_single(self, xml_path: str):
-        data = self._init_json()
-        img_info, obj_info = Xml.parse_xml_info(xml_path)
-        data['imagePath'] = img_info[0]
-        data['imageHeight'] = img_info[2]
-        data['imageWidth'] = img_info[1]
+
+    @staticmethod
+    def _to_json(ann: ImageAnnotation, with_group=False, indent=None) -> bytes:
+        ''' labelme json content of one image
+        '''
+        data = Xml2labelme._init_json()
+        data['imagePath'] = ann.img_name
+        data['imageHeight'] = int(ann.height)
+        data['imageWidth'] = int(ann.width)
         group_id = 0
-        for obj_name, bboxes in obj_info.items():
+        for obj_name, bboxes in ann.groups():
             for bbox in bboxes:
                 shape = dict(shape_type='rectangle', flags={})
                 shape['label'] = obj_name
-                shape['points'] = [bbox[:2], bbox[2:]]
-                if self.with_group:
+                shape['points'] = [[int(bbox[0]), int(bbox[1])],
+                                   [int(bbox[2]), int(bbox[3])]]
+                if with_group:
                     shape['group_id'] = group_id
                     group_id += 1
                 data['shapes'].append(shape)
+        return Xml2labelme._dumps(data, indent)
+
+    def _convert_single(self, xml_path: str):
+        prof = self.profiler
+        with prof.stage('xml_parse'):
+            ann = Xml.parse_annotation(xml_path)
+        if prof.enabled:
+            prof.add_bytes('file_read', Path(xml_path).stat().st_size)
+
+        with prof.stage('json_dump'):
+            data = self._to_json(ann, self.with_group, self.indent)
+        with prof.stage('file_write'):
+            atomic_write(self._out_path(xml_path), data)
+        prof.add_bytes('file_write', len(data))
+        prof.add('items')
+
+    def _out_path(self, xml_path: str) -> Path:
+        return self.out_dir.joinpath(Path(xml_path).stem + '.json')
+
+    @staticmethod
+    def _dumps(data: dict, indent=None) -> bytes:
+        ''' serialize labelme data, all values should be python native types
+        '''
+        if indent is None:
+            if orjson is not None:
+                return orjson.dumps(data)
+            return json.dumps(data, separators=(',', ':')).encode('utf-8')
+        return json.dumps(data, indent=indent).encode('utf-8')
+
+    def _get_xml_list(self) -> List[str]:
+        ''' xml list of current shard
+        '''
+        xml_list = Xml.get_xml_list(str(self.xml_dir), sort=True)
+        weights = None
+        if self.num_shards > 1 and self.shard_balance:
+            weights = [Path(p).stat().st_size for p in xml_list]
+        return split_shards(xml_list, self.num_shards, self.shard_index, weights)
+
+    def _iter_todo(self, journal: Journal):
+        ''' xml paths to convert, without sharding they are yielded while the
+        directory is scanned, so converting starts before the listing ends
+        '''
+        if self.num_shards > 1:
+            return journal.todo(self._get_xml_list())
+        return (p for p in Xml.iter_xml_list(str(self.xml_dir)) if p not in journal)
+
+    def _open_journal(self) -> Journal:
+        return Journal(journal_path(self.out_dir, self.num_shards, self.shard_index),
+                       self.resume)
 
-        json_name = Path(xml_path).stem + '.json'
-        out_json = self.out_dir.joinpath(json_name)
-        with open(out_json, 'w') as f:
-            json.dump(data, f, indent=2, cls=MyEncoder)     
+    def _finish(self, done):
+        if self.num_shards > 1:
+            write_manifest(str(self.out_dir), self.num_shards, self.shard_index, done)
 
     def convert(self):
+        from tqdm import tqdm
         if not self.out_dir.exists():
             self.out_dir.mkdir(parents=True)
 
-        xml_list = Xml.get_xml_list(str(self.xml_dir))
-        for xml_path in tqdm(xml_list):
-            self._convert_single(xml_path)
+        with self._open_journal() as journal:
+            for xml_path in tqdm(self._iter_todo(journal)):
+                self._convert_single(xml_path)
+                journal.add(xml_path)
+            self._finish(journal.done)
 
     def convert_thread(self, threads=4):
+        from tqdm import tqdm
         from multiprocessing.pool import ThreadPool
         if not self.out_dir.exists():
             self.out_dir.mkdir(parents=True)
 
-        xml_list = Xml.get_xml_list(str(self.xml_dir))
-        with ThreadPool(threads) as p:
-            return list(tqdm(p.imap(self._convert_single, xml_list), total=len(xml_list)))
\ No newline at end of file
+        with self._open_journal() as journal:
+            xml_list = journal.todo(self._get_xml_list())
+            results = []
+            with ThreadPool(threads) as p:
+                for xml_path, result in zip(xml_list, tqdm(
+                        p.imap(self._convert_single, xml_list), total=len(xml_list))):
+                    journal.add(xml_path)
+                    results.append(result)
+            self._finish(journal.done)
+        return results
+
+    def convert_process(self, processes=4):
+        from tqdm import tqdm
+        from multiprocessing import Pool
+        if not self.out_dir.exists():
+            self.out_dir.mkdir(parents=True)
+
+        with self._open_journal() as journal:
+            xml_list = journal.todo(self._get_xml_list())
+            chunksize = max(1, len(xml_list) // (processes * 16))
+            results = []
+            # a module level function with small arguments is sent to the
+            # workers, a bound method would pickle the whole instance
+            convert_fn = partial(_convert_labelme_file, out_dir=str(self.out_dir),
+                                 with_group=self.with_group, indent=self.indent)
+            with Pool(processes) as p:
+                for xml_path, result in zip(xml_list, tqdm(
+                        p.imap(convert_fn, xml_list, chunksize), total=len(xml_list))):
+                    journal.add(xml_path)
+                    results.append(result)
+            self._finish(journal.done)
+        return results
+
+    def _read(self, xml_path: str) -> bytes:
+        with self.profiler.stage('file_read'):
+            return Path(xml_path).read_bytes()
+
+    def _write(self, xml_path: str, data: bytes):
+        with self.profiler.stage('file_write'):
+            atomic_write(self._out_path(xml_path), data)
+        self.profiler.add_bytes('file_write', len(data))
+
+    def convert_pipeline(self, readers=4, workers=2, writers=2, queue_size=64,
+                         executor=None):
+        ''' overlap xml reading, converting (in processes) and writing,
+        see utils.pipeline.Pipeline, executor is an optional shared pool
+        '''
+        from tqdm import tqdm
+        if not self.out_dir.exists():
+            self.out_dir.mkdir(parents=True)
+
+        compute_fn = partial(_xml_bytes_to_labelme, with_group=self.with_group,
+                             indent=self.indent)
+        pipeline = Pipeline(self._read, compute_fn, self._write,
+                            readers, workers, writers, queue_size, executor=executor)
+        with self._open_journal() as journal:
+            xml_list = self._iter_todo(journal)
+            total = len(xml_list) if isinstance(xml_list, list) else None
+            with tqdm(total=total) as progress:
+                failed = pipeline.run(xml_list, journal.add_many, progress)
+            self._finish(journal.done)
+        return failed
+
+
+def _xml_bytes_to_labelme(data: bytes, with_group=False, indent=None) -> bytes:
+    ''' compute stage of Xml2labelme.convert_pipeline, runs in worker processes
+    '''
+    return Xml2labelme._to_json(Xml.parse_annotation_bytes(data), with_group, indent)
+
+
+def _convert_labelme_file(xml_path: str, out_dir: str, with_group=False, indent=None):
+    ''' convert one xml file, runs in worker processes of Xml2labelme.convert_process
+    '''
+    data = _xml_bytes_to_labelme(Path(xml_path).read_bytes(), with_group, indent)
+    atomic_write(Path(out_dir).joinpath(Path(xml_path).stem + '.json'), data)
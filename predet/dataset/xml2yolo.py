@@ -1,7 +1,39 @@
 from pathlib import Path
-from tqdm import tqdm
+from functools import partial
 from typing import List, Union
 from .xml_format import XmlFormat as Xml
+from .annotation import ImageAnnotation
+from ..utils.shard import split_shards, write_manifest
+from ..utils.checkpoint import Journal, atomic_write, journal_path
+from ..utils.profiler import Profiler, NULL_PROFILER
+from ..utils.pipeline import Pipeline
+
+
+def _yolo_rows(ann: ImageAnnotation, classes: List[str]) -> bytes:
+    ''' yolo txt content of one image
+    '''
+    img_w, img_h = ann.width, ann.height
+    data = []
+    for label, bbox in ann.groups():
+        if label not in classes:
+            continue
+        cls_id = classes.index(label)
+        for box in bbox:
+            x1, y1, x2, y2 = box
+            cx, cy = (x1+x2) * 0.5, (y1+y2) * 0.5
+            bw, bh = x2-x1, y2-y1
+            norm_cx, norm_cy = cx / img_w, cy / img_h
+            norm_bw, norm_bh = bw / img_w, bh / img_h
+            row_list = [cls_id, norm_cx, norm_cy, norm_bw, norm_bh]
+            row_str = ' '.join(list(map(str, row_list))) + '\n'
+            data.append(row_str)
+    return ''.join(data).encode('utf-8')
+
+
+def _xml_bytes_to_yolo(data: bytes, classes: List[str]) -> bytes:
+    ''' compute stage of Xml2Yolo.convert_pipeline, runs in worker processes
+    '''
+    return _yolo_rows(Xml.parse_annotation_bytes(data), classes)
 
 
 class Xml2Yolo(object):
@@ -11,7 +43,23 @@ class Xml2Yolo(object):
     def __init__(self,
                  xml_dir: str,
                  out_dir: str,
-                 cls_txt: Union[str, List]):
+                 cls_txt: Union[str, List],
+                 num_shards=1,
+                 shard_index=0,
+                 shard_balance=False,
+                 resume=False,
+                 profiler: Profiler=None):
+        '''
+        Args:
+            xml_dir: [str], xml annotation directory
+            out_dir: [str], yolo txt save directory
+            cls_txt: [str | list], class list or class file
+            num_shards: [int], total shard number for distributed runs, default 1
+            shard_index: [int], index of the shard processed by this instance
+            shard_balance: [bool], balance shards by xml file size, default False
+            resume: [bool], skip xml files finished by a previous run, default False
+            profiler: [Profiler], collect per-stage timing, default None (disabled)
+        '''
         super(Xml2Yolo, self).__init__()
         # self.xml = Xml(xml_dir)
         self.xml_dir = Path(xml_dir)
@@ -23,6 +71,11 @@ class Xml2Yolo(object):
         else:
             assert isinstance(cls_txt, (list, tuple))
             self.classes = cls_txt
+        self.num_shards = num_shards
+        self.shard_index = shard_index
+        self.shard_balance = shard_balance
+        self.resume = resume
+        self.profiler = profiler if profiler is not None else NULL_PROFILER
 
     def _load_classes(self, cls_txt: str, ignore='#') -> List[str]:
         ''' load classes info from file
@@ -32,41 +85,97 @@ class Xml2Yolo(object):
                 if not line.startswith(ignore)]
         
     def _convert_single(self, xml_path: str):
-        img_info, obj_info = Xml.parse_xml_info(xml_path)
+        prof = self.profiler
+        with prof.stage('xml_parse'):
+            ann = Xml.parse_annotation(xml_path)
+        if prof.enabled:
+            prof.add_bytes('file_read', Path(xml_path).stat().st_size)
         txt_path = self.out_dir.joinpath(Path(xml_path).stem + '.txt')
-        _, img_w, img_h, _ = img_info
-
-        data = []
-        for label, bbox in obj_info.items():
-            if label not in self.classes:
-                continue
-            cls_id = self.classes.index(label)
-            for box in bbox:
-                x1, y1, x2, y2 = box
-                cx, cy = (x1+x2) * 0.5, (y1+y2) * 0.5
-                bw, bh = x2-x1, y2-y1
-                norm_cx, norm_cy = cx / img_w, cy / img_h
-                norm_bw, norm_bh = bw / img_w, bh / img_h
-                row_list = [cls_id, norm_cx, norm_cy, norm_bw, norm_bh]
-                row_str = ' '.join(list(map(str, row_list))) + '\n'
-                data.append(row_str)
-        with txt_path.open('w') as f:
-            f.writelines(data)
+        with prof.stage('convert'):
+            data = _yolo_rows(ann, self.classes)
+        with prof.stage('file_write'):
+            atomic_write(txt_path, data)
+        prof.add_bytes('file_write', len(data))
+        prof.add('items')
+
+    def _get_xml_list(self) -> List[str]:
+        ''' xml list of current shard
+        '''
+        xml_list = Xml.get_xml_list(str(self.xml_dir), sort=True)
+        weights = None
+        if self.num_shards > 1 and self.shard_balance:
+            weights = [Path(p).stat().st_size for p in xml_list]
+        return split_shards(xml_list, self.num_shards, self.shard_index, weights)
+
+    def _iter_todo(self, journal: Journal):
+        ''' xml paths to convert, without sharding they are yielded while the
+        directory is scanned, so converting starts before the listing ends
+        '''
+        if self.num_shards > 1:
+            return journal.todo(self._get_xml_list())
+        return (p for p in Xml.iter_xml_list(str(self.xml_dir)) if p not in journal)
+
+    def _open_journal(self) -> Journal:
+        return Journal(journal_path(self.out_dir, self.num_shards, self.shard_index),
+                       self.resume)
+
+    def _finish(self, done):
+        if self.num_shards > 1:
+            write_manifest(str(self.out_dir), self.num_shards, self.shard_index, done)
 
     def convert(self):
+        from tqdm import tqdm
         if not self.out_dir.exists():
             self.out_dir.mkdir(parents=True)
 
-        for xml_path in tqdm(Xml.get_xml_list(str(self.xml_dir))):
-            self._convert_single(xml_path)
+        with self._open_journal() as journal:
+            for xml_path in tqdm(self._iter_todo(journal)):
+                self._convert_single(xml_path)
+                journal.add(xml_path)
+            self._finish(journal.done)
 
     def convert_thread(self, threads=4):
+        from tqdm import tqdm
         from multiprocessing.pool import ThreadPool
         if not self.out_dir.exists():
             self.out_dir.mkdir(parents=True)
 
-        xml_list = Xml.get_xml_list(str(self.xml_dir))
-        with ThreadPool(threads) as p:
-            return list(tqdm(p.imap(self._convert_single, xml_list), total=len(xml_list)))
+        with self._open_journal() as journal:
+            xml_list = journal.todo(self._get_xml_list())
+            results = []
+            with ThreadPool(threads) as p:
+                for xml_path, result in zip(xml_list, tqdm(
+                        p.imap(self._convert_single, xml_list), total=len(xml_list))):
+                    journal.add(xml_path)
+                    results.append(result)
+            self._finish(journal.done)
+        return results
+
+    def _read(self, xml_path: str) -> bytes:
+        with self.profiler.stage('file_read'):
+            return Path(xml_path).read_bytes()
+
+    def _write(self, xml_path: str, data: bytes):
+        with self.profiler.stage('file_write'):
+            atomic_write(self.out_dir.joinpath(Path(xml_path).stem + '.txt'), data)
+        self.profiler.add_bytes('file_write', len(data))
+
+    def convert_pipeline(self, readers=4, workers=2, writers=2, queue_size=64,
+                         executor=None):
+        ''' overlap xml reading, converting (in processes) and writing,
+        see utils.pipeline.Pipeline, executor is an optional shared pool
+        '''
+        from tqdm import tqdm
+        if not self.out_dir.exists():
+            self.out_dir.mkdir(parents=True)
 
-     
\ No newline at end of file
+        pipeline = Pipeline(self._read, partial(_xml_bytes_to_yolo, classes=list(self.classes)),
+                            self._write, readers, workers, writers, queue_size,
+                            executor=executor)
+        with self._open_journal() as journal:
+            xml_list = self._iter_todo(journal)
+            total = len(xml_list) if isinstance(xml_list, list) else None
+            with tqdm(total=total) as progress:
+                failed = pipeline.run(xml_list, journal.add_many, progress)
+            self._finish(journal.done)
+        return failed
@@ -1,7 +1,12 @@
+import os
 import xml.etree.ElementTree as ET
 from pathlib import Path
+from functools import lru_cache
 from collections import Counter
-from typing import List, Tuple, Dict, Set
+from typing import List, Tuple, Dict, Set, Iterator
+from ..utils.checkpoint import atomic_write
+from ..utils.file_io import iter_file_path
+from .annotation import ImageAnnotation
 
 
 def indent(elem, level=0):
@@ -17,6 +22,45 @@ def indent(elem, level=0):
         elem.tail = i
     return elem
 
+
+# same layout as ElementTree output indented by indent()
+_XML_HEAD = (
+    '<annotation>\n'
+    '  <folder>{}</folder>\n'
+    '  <filename>{}</filename>\n'
+    '  <path>{}</path>\n'
+    '  <size>\n'
+    '    <width>{}</width>\n'
+    '    <height>{}</height>\n'
+    '    <depth>{}</depth>\n'
+    '  </size>')
+_XML_OBJECT = (
+    '\n  <object>\n'
+    '    {}\n'
+    '    <pose>Unspecified</pose>\n'
+    '    <truncated>0</truncated>\n'
+    '    <difficult>0</difficult>\n'
+    '    <bndbox>\n'
+    '      <xmin>{}</xmin>\n'
+    '      <ymin>{}</ymin>\n'
+    '      <xmax>{}</xmax>\n'
+    '      <ymax>{}</ymax>\n'
+    '    </bndbox>\n'
+    '  </object>')
+_XML_TAIL = '\n</annotation>'
+
+
+def escape(data: str) -> str:
+    ''' same as xml.sax.saxutils.escape, which imports urllib on load
+    '''
+    return data.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+@lru_cache(maxsize=1024)
+def _resolve_dir(abs_dir: str) -> str:
+    return str(Path(abs_dir).resolve())
+
+
 class XmlFormat(object):
     '''xml annotations analysis with specified xml directory
     '''
@@ -29,6 +73,14 @@ class XmlFormat(object):
         xml_list = [str(p.absolute()) for p in xml_list]
         return sorted(xml_list) if sort else xml_list
 
+    @staticmethod
+    def iter_xml_list(xml_dir: str) -> Iterator[str]:
+        ''' yield xml absolute paths in xml_dir (not recursive) while the
+        directory is scanned, in directory order, see utils.file_io.iter_file_path,
+        a missing xml_dir raises FileNotFoundError at the call
+        '''
+        return (os.path.abspath(p) for p in iter_file_path(xml_dir, ['.xml'], recursive=False))
+
     @staticmethod
     def get_obj_num(xml_path: str) -> int:
         '''get object number from xml annotation
@@ -90,33 +142,43 @@ class XmlFormat(object):
                                ...
                                }
         '''
+        return XmlFormat.parse_annotation(xml_path).to_legacy()
+
+    @staticmethod
+    def parse_xml_bytes(data: bytes) -> Tuple[List, Dict]:
+        ''' parse xml annotation info from file content, see parse_xml_info
+        '''
+        return XmlFormat._parse_root(ET.fromstring(data)).to_legacy()
+
+    @staticmethod
+    def parse_annotation(xml_path: str) -> ImageAnnotation:
+        ''' parse xml annotation into a compact record, see annotation.ImageAnnotation
+        '''
         assert Path(xml_path).exists(), f"{xml_path} not exist!"
+        return XmlFormat._parse_root(ET.parse(xml_path).getroot())
 
-        tree=ET.parse(xml_path)
-        root=tree.getroot()
-        img_name = root.find('filename').text
-        img_width = int(root.find('size/width').text)
-        img_height = int(root.find('size/height').text)
-        img_depth = int(root.find('size/depth').text)
-        img_info = [img_name, img_width, img_height, img_depth]
+    @staticmethod
+    def parse_annotation_bytes(data: bytes) -> ImageAnnotation:
+        ''' parse xml annotation from file content, see parse_annotation
+        '''
+        return XmlFormat._parse_root(ET.fromstring(data))
 
-        obj_info = {}
+    @staticmethod
+    def _parse_root(root: ET.Element) -> ImageAnnotation:
+        ann = ImageAnnotation(root.find('filename').text,
+                              int(root.find('size/width').text),
+                              int(root.find('size/height').text),
+                              int(root.find('size/depth').text))
         for obj in root.findall('object'):
-            obj_name = obj.find('name').text
-            xmin = int(obj.find('bndbox/xmin').text)
-            ymin = int(obj.find('bndbox/ymin').text)
-            xmax = int(obj.find('bndbox/xmax').text)
-            ymax = int(obj.find('bndbox/ymax').text)
-
-            if obj_name not in obj_info.keys():
-                obj_info[obj_name] = []
-            obj_info[obj_name].append((xmin, ymin, xmax, ymax))
-        
-        return img_info, obj_info
+            bndbox = obj.find('bndbox')
+            ann.add(obj.find('name').text,
+                    (int(bndbox.find('xmin').text), int(bndbox.find('ymin').text),
+                     int(bndbox.find('xmax').text), int(bndbox.find('ymax').text)))
+        return ann
     
     @staticmethod
-    def dump_xml(img_info: List, obj_info: Dict, out_path: str):
-        '''dump xml annotation with image info and object info
+    def dumps_xml(img_info: List, obj_info: Dict, out_path: str) -> bytes:
+        '''serialize xml annotation with image info and object info
 
         Args:
             img_info: [list], [img_name, W, H, C]
@@ -125,52 +187,64 @@ class XmlFormat(object):
                                ...
                                }
 
+        Return:
+            [bytes], xml content to be saved at out_path
+
         Note: truncation and difficult info are set to 0.    
         '''
+        return XmlFormat._dumps(img_info, obj_info.items(), out_path)
+
+    @staticmethod
+    def dumps_annotation(ann: ImageAnnotation, out_path: str) -> bytes:
+        '''serialize a compact annotation record, see dumps_xml
+        '''
+        return XmlFormat._dumps(ann.img_info, ann.groups(), out_path)
+
+    @staticmethod
+    def _dumps(img_info: List, groups, out_path: str) -> bytes:
         p = Path(out_path)
         assert p.suffix == '.xml', "invalid output xml path!"
-        out_dir, xml_name = p.parent.resolve(), p.name
-
-        root = ET.Element('annotation')
-        folder = ET.SubElement(root, 'folder')
-        folder.text = str(out_dir)
-        filename = ET.SubElement(root, 'filename')
+        # resolving touches every path component, cache it per directory
+        out_dir, xml_name = _resolve_dir(os.path.abspath(p.parent)), p.name
         img_ext = img_info[0].split('.')[-1]
         img_name = xml_name.replace('.xml', '.'+img_ext)
-        filename.text = img_name
-        path = ET.SubElement(root, 'path')
-        path.text = str(out_dir.joinpath(img_name))
-        size = ET.SubElement(root, 'size')
-        width = ET.SubElement(size, 'width')
-        height = ET.SubElement(size, 'height')
-        depth = ET.SubElement(size, 'depth')
-        width.text = str(img_info[1])
-        height.text = str(img_info[2])
-        depth.text = str(img_info[3])
-
-        for obj_name, bbox in obj_info.items():
+
+        parts = [_XML_HEAD.format(
+            escape(out_dir), escape(img_name), escape(str(Path(out_dir).joinpath(img_name))),
+            escape(str(img_info[1])), escape(str(img_info[2])), escape(str(img_info[3])))]
+        for obj_name, bbox in groups:
+            name = f'<name>{escape(obj_name)}</name>' if obj_name else '<name />'
             for box in bbox:
-                object_root = ET.SubElement(root, 'object')
-                name = ET.SubElement(object_root, 'name')
-                name.text = obj_name
-                pose = ET.SubElement(object_root, 'pose')
-                pose.text = "Unspecified"
-                trunc = ET.SubElement(object_root, 'truncated')
-                trunc.text = "0"
-                diff = ET.SubElement(object_root, 'difficult')
-                diff.text = "0"
-                bndbox = ET.SubElement(object_root, 'bndbox')
-                xmin = ET.SubElement(bndbox, 'xmin')
-                xmin.text = str(int(box[0]))
-                ymin = ET.SubElement(bndbox, 'ymin')
-                ymin.text = str(int(box[1]))
-                xmax = ET.SubElement(bndbox, 'xmax')
-                xmax.text = str(int(box[2]))
-                ymax = ET.SubElement(bndbox, 'ymax')
-                ymax.text = str(int(box[3]))
-        indent(root)
-        tree = ET.ElementTree(root)
-        tree.write(out_path)
+                parts.append(_XML_OBJECT.format(
+                    name, int(box[0]), int(box[1]), int(box[2]), int(box[3])))
+        parts.append(_XML_TAIL)
+        # ElementTree writes us-ascii with character references by default
+        return ''.join(parts).encode('ascii', 'xmlcharrefreplace')
+
+    @staticmethod
+    def dump_xml(img_info: List, obj_info: Dict, out_path: str):
+        '''dump xml annotation with image info and object info, see dumps_xml
+        '''
+        atomic_write(out_path, XmlFormat.dumps_xml(img_info, obj_info, out_path))
+
+    @staticmethod
+    def dump_xml_batch(items: List[Tuple[List, Dict, str]], threads=1):
+        '''dump many xml annotations, e.g. all slices of an image
+
+        Args:
+            items: [list], [(img_info, obj_info, out_path), ...], see dumps_xml
+            threads: [int], write with a thread pool if larger than 1, which
+                     hides per-file latency on network storage
+        '''
+        data = [(out_path, XmlFormat.dumps_xml(img_info, obj_info, out_path))
+                for img_info, obj_info, out_path in items]
+        if threads <= 1:
+            for out_path, xml_bytes in data:
+                atomic_write(out_path, xml_bytes)
+            return
+        from multiprocessing.pool import ThreadPool
+        with ThreadPool(threads) as p:
+            p.starmap(atomic_write, data)
 
     def __init__(self, xml_dir):
         self.xml_dir = xml_dir
@@ -0,0 +1,141 @@
+import json
+import logging
+import numpy as np
+from typing import Dict
+from .xml_format import XmlFormat as Xml
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_single(xml_path: str):
+    ''' parse one xml in worker processes, errors are returned instead of
+    aborting the whole pool
+
+    Return:
+        (annotation, None) or (None, error message)
+    '''
+    try:
+        return Xml.parse_annotation(xml_path), None
+    except Exception as e:  # ET.ParseError, missing fields, non int values
+        return None, str(e)
+
+
+class XmlStatistics(object):
+    ''' dataset level statistics of xml annotations
+
+    All xml files are parsed once (in parallel) into flat arrays:
+        img_sizes: [np.ndarray], (M, 2), image W, H
+        boxes: [np.ndarray], (N, 4), x1, y1, x2, y2
+        img_ids: [np.ndarray], (N, ), image index of each box
+        cls_ids: [np.ndarray], (N, ), index of each box in self.classes
+    and the statistics are computed with numpy on these arrays. Unreadable
+    xml files are skipped and listed in self.failed.
+    '''
+    # COCO area thresholds
+    SMALL_AREA = 32 ** 2
+    LARGE_AREA = 96 ** 2
+
+    def __init__(self, xml_dir: str, processes=4):
+        self.xml_dir = xml_dir
+        self.xml_list = Xml.get_xml_list(xml_dir, sort=True)
+        self.processes = processes
+        self.failed = []
+
+        self.classes = []
+        self.img_sizes = np.zeros((0, 2), dtype=np.int64)
+        self.boxes = np.zeros((0, 4), dtype=np.float64)
+        self.img_ids = np.zeros((0, ), dtype=np.int64)
+        self.cls_ids = np.zeros((0, ), dtype=np.int64)
+
+    def load(self):
+        ''' parse all xml annotations into arrays
+        '''
+        from tqdm import tqdm
+        from multiprocessing import Pool
+        chunksize = max(1, len(self.xml_list) // (self.processes * 16))
+        if self.processes > 1:
+            with Pool(self.processes) as p:
+                results = list(tqdm(p.imap(_parse_single, self.xml_list, chunksize),
+                                    total=len(self.xml_list)))
+        else:
+            results = list(map(_parse_single, tqdm(self.xml_list)))
+
+        self.failed = []
+        anns = []
+        for xml_path, (ann, error) in zip(self.xml_list, results):
+            if ann is None:
+                logger.warning(f"{xml_path}: skipped, {error}")
+                self.failed.append(xml_path)
+            else:
+                anns.append(ann)
+
+        cls_map = {}
+        img_sizes, boxes, img_ids, cls_ids = [], [], [], []
+        for img_id, ann in enumerate(anns):
+            img_sizes.append((ann.width, ann.height))
+            boxes.extend(ann.boxes)  # flat x1, y1, x2, y2, ...
+            img_ids.extend([img_id] * len(ann))
+            name_ids = [cls_map.setdefault(name, len(cls_map)) for name in ann.names]
+            cls_ids.extend([name_ids[cls_id] for cls_id in ann.cls_ids])
+
+        self.classes = list(cls_map.keys())
+        self.img_sizes = np.array(img_sizes, dtype=np.int64).reshape(-1, 2)
+        self.boxes = np.array(boxes, dtype=np.float64).reshape(-1, 4)
+        self.img_ids = np.array(img_ids, dtype=np.int64)
+        self.cls_ids = np.array(cls_ids, dtype=np.int64)
+        logger.info(f"{len(self.img_sizes)} images, {len(self.boxes)} objects, "
+                    f"{len(self.classes)} classes loaded, {len(self.failed)} xml unreadable")
+        return self
+
+    @staticmethod
+    def _histogram(values: np.ndarray, bins) -> Dict:
+        counts, edges = np.histogram(values, bins=bins)
+        return dict(counts=counts.tolist(), edges=edges.tolist())
+
+    def report(self, bins=20) -> Dict:
+        ''' compute dataset statistics
+
+        Args:
+            bins: [int], bin number of histograms
+
+        Return:
+            [dict], json serializable statistics
+        '''
+        box_w = self.boxes[:, 2] - self.boxes[:, 0]
+        box_h = self.boxes[:, 3] - self.boxes[:, 1]
+        area = box_w * box_h
+        valid = (box_w > 0) & (box_h > 0)
+        img_wh = self.img_sizes[self.img_ids]
+        out_bound = (self.boxes[:, 0] < 0) | (self.boxes[:, 1] < 0) | \
+            (self.boxes[:, 2] > img_wh[:, 0]) | (self.boxes[:, 3] > img_wh[:, 1])
+        obj_per_img = np.bincount(self.img_ids, minlength=len(self.img_sizes))
+        cls_count = np.bincount(self.cls_ids, minlength=len(self.classes))
+
+        valid_area = area[valid]
+        aspect = box_w[valid] / box_h[valid]
+        return dict(
+            image_num=int(len(self.img_sizes)),
+            unreadable_num=len(self.failed),
+            object_num=int(len(self.boxes)),
+            class_count={name: int(cls_count[i]) for i, name in enumerate(self.classes)},
+            objects_per_image=dict(
+                mean=float(obj_per_img.mean()) if len(obj_per_img) else 0.,
+                max=int(obj_per_img.max()) if len(obj_per_img) else 0,
+                empty_images=int((obj_per_img == 0).sum()),
+                histogram=self._histogram(obj_per_img, bins)),
+            scale=dict(
+                small=int((valid_area < self.SMALL_AREA).sum()),
+                medium=int(((valid_area >= self.SMALL_AREA) &
+                            (valid_area < self.LARGE_AREA)).sum()),
+                large=int((valid_area >= self.LARGE_AREA).sum())),
+            box_width=self._histogram(box_w[valid], bins),
+            box_height=self._histogram(box_h[valid], bins),
+            box_sqrt_area=self._histogram(np.sqrt(valid_area), bins),
+            log2_aspect_ratio=self._histogram(np.log2(aspect), bins),
+            degenerate_num=int((~valid).sum()),
+            out_of_bounds_num=int(out_bound.sum()),
+        )
+
+    def save_report(self, out_path: str, bins=20):
+        with open(out_path, 'w') as f:
+            json.dump(self.report(bins), f, indent=2)
@@ -0,0 +1,216 @@
+import os
+import json
+import shutil
+import logging
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from functools import partial
+from collections import Counter
+from typing import Dict, Tuple
+from .xml_format import XmlFormat as Xml
+from ..utils.checkpoint import atomic_write
+
+logger = logging.getLogger(__name__)
+
+MODES = ('report', 'clip', 'drop')
+
+
+def _check_box(box: Tuple, width: int, height: int) -> str:
+    ''' issue type of a box, None if the box is valid
+    '''
+    x1, y1, x2, y2 = box
+    if x2 < x1 or y2 < y1:
+        return 'inverted'
+    if x2 == x1 or y2 == y1:
+        return 'zero_area'
+    if width > 0 and height > 0 and (x1 < 0 or y1 < 0 or x2 > width or y2 > height):
+        return 'out_of_image'
+    return None
+
+
+def _validate_single(xml_path: str, img_dir: str=None, img_ext='.jpg',
+                     mode='report', out_dir: str=None) -> Tuple[str, list, str]:
+    ''' validate (and repair) one xml annotation, run in worker processes
+
+    Return:
+        (xml name, issues, output state), output state is one of
+        'fixed', 'copied', 'unchanged' or 'skipped'
+    '''
+    from PIL import Image
+    xml_name = os.path.basename(xml_path)
+    try:
+        with open(xml_path, 'rb') as f:
+            data = f.read()
+        root = ET.fromstring(data)
+        ann = Xml._parse_root(root)
+    except Exception as e:  # ET.ParseError, missing fields, non int values
+        return xml_name, [dict(type='invalid_xml', message=str(e))], 'skipped'
+
+    issues = []
+    width, height = ann.width, ann.height
+    resized = False
+    if img_dir is not None:
+        img_path = os.path.join(img_dir, os.path.splitext(xml_name)[0] + img_ext)
+        try:
+            with Image.open(img_path) as img:  # only the header is read
+                img_w, img_h = img.size
+        except FileNotFoundError:
+            issues.append(dict(type='image_missing', image=img_path))
+        except Exception as e:
+            issues.append(dict(type='image_invalid', image=img_path, message=str(e)))
+        else:
+            if (img_w, img_h) != (width, height):
+                issues.append(dict(type='size_mismatch', xml=[width, height],
+                                   image=[img_w, img_h],
+                                   action='reported' if mode == 'report' else 'fixed'))
+                width, height = img_w, img_h
+                resized = mode != 'report'
+    if width <= 0 or height <= 0:
+        issues.append(dict(type='invalid_size', size=[width, height]))
+
+    # repairs edit the parsed tree in place, so other fields (pose,
+    # truncated, difficult, folder, path, ...) are kept as they are
+    objects = root.findall('object')
+    for i in range(len(ann)):
+        box = ann.box(i)
+        issue = _check_box(box, width, height)
+        if issue is None:
+            continue
+        action = 'reported'
+        if mode == 'drop' or (mode == 'clip' and issue != 'out_of_image'):
+            action = 'dropped'
+        elif mode == 'clip':
+            x1, y1, x2, y2 = box
+            box = (max(0, x1), max(0, y1), min(width, x2), min(height, y2))
+            action = 'clipped' if box[2] > box[0] and box[3] > box[1] else 'dropped'
+        issues.append(dict(type=issue, name=ann.names[ann.cls_ids[i]],
+                           box=list(ann.box(i)), action=action))
+        if action == 'dropped':
+            root.remove(objects[i])
+        elif action == 'clipped':
+            bndbox = objects[i].find('bndbox')
+            for key, value in zip(('xmin', 'ymin', 'xmax', 'ymax'), box):
+                bndbox.find(key).text = str(value)
+
+    if mode == 'report' or out_dir is None:
+        return xml_name, issues, 'unchanged'
+    out_path = os.path.join(out_dir, xml_name)
+    if resized or any(issue.get('action', 'reported') != 'reported' for issue in issues):
+        if resized:
+            root.find('size/width').text = str(width)
+            root.find('size/height').text = str(height)
+        content = ET.tostring(root, encoding='unicode').encode('utf-8')
+        if data.lstrip().startswith(b'<?xml'):
+            content = b'<?xml version="1.0" encoding="utf-8"?>\n' + content
+        atomic_write(out_path, content)
+        return xml_name, issues, 'fixed'
+    if os.path.abspath(out_path) != os.path.abspath(xml_path):
+        shutil.copyfile(xml_path, out_path)
+        return xml_name, issues, 'copied'
+    return xml_name, issues, 'unchanged'
+
+
+class XmlValidator(object):
+    ''' validate xml annotations, and optionally repair them
+
+    Checked issues:
+        invalid_xml: xml can not be parsed
+        image_missing / image_invalid: image not found or unreadable
+        size_mismatch: size/width, size/height differ from the image header
+        invalid_size: size/width or size/height is not positive
+        inverted / zero_area: xmax < xmin (ymax < ymin), or equal
+        out_of_image: box exceeds the image (real image size if img_dir given)
+
+    Modes:
+        report: only report, nothing is written
+        clip: clip out_of_image boxes to the image, drop the other bad boxes
+        drop: drop all bad boxes
+    In clip and drop modes size fields are set to the image header size.
+    Repaired files only have the bad bndbox (and size) elements edited or
+    their object removed, all other fields are kept; other files are copied
+    unchanged to out_dir. Invalid xml files are only reported.
+
+    example:
+        validator = XmlValidator('xml', 'images', mode='clip', out_dir='xml_fixed')
+        validator.run()
+        validator.save_report('validate.json')
+    '''
+
+    def __init__(self,
+                 xml_dir: str,
+                 img_dir: str=None,
+                 img_ext='.jpg',
+                 mode='report',
+                 out_dir: str=None,
+                 processes=4):
+        '''
+        Args:
+            xml_dir: [str], xml annotation directory
+            img_dir: [str], image directory to check size fields, default None
+            img_ext: [str], image extension, default '.jpg'
+            mode: [str], 'report', 'clip' or 'drop', default 'report'
+            out_dir: [str], repaired xml directory, default None (xml_dir, in place)
+            processes: [int], processes num for validation, default 4
+        '''
+        assert Path(xml_dir).exists(), f"{xml_dir} not found!"
+        assert img_dir is None or Path(img_dir).exists(), f"{img_dir} not found!"
+        assert mode in MODES, f"mode must be one of {MODES}!"
+        self.xml_dir = xml_dir
+        self.img_dir = img_dir
+        self.img_ext = img_ext
+        self.mode = mode
+        self.out_dir = None
+        if mode != 'report':
+            self.out_dir = str(Path(out_dir if out_dir else xml_dir).absolute())
+            Path(self.out_dir).mkdir(parents=True, exist_ok=True)
+        self.processes = processes
+        self.xml_list = Xml.get_xml_list(xml_dir, sort=True)
+        self.report = {}
+
+    def run(self) -> Dict:
+        ''' validate all xml annotations
+
+        Return:
+            report: [dict], {'summary': {...}, 'files': {xml name: [issue, ...]}},
+                    only files with issues are listed
+        '''
+        from tqdm import tqdm
+        fn = partial(_validate_single, img_dir=self.img_dir, img_ext=self.img_ext,
+                     mode=self.mode, out_dir=self.out_dir)
+        files, issue_count, action_count, state_count = {}, Counter(), Counter(), Counter()
+        if self.processes > 1:
+            from multiprocessing import Pool
+            chunksize = max(1, min(256, len(self.xml_list) // (self.processes * 16)))
+            with Pool(self.processes) as p:
+                results = tqdm(p.imap_unordered(fn, self.xml_list, chunksize),
+                               total=len(self.xml_list))
+                self._collect(results, files, issue_count, action_count, state_count)
+        else:
+            self._collect(map(fn, tqdm(self.xml_list)),
+                          files, issue_count, action_count, state_count)
+
+        summary = dict(mode=self.mode, xml_num=len(self.xml_list),
+                       issue_file_num=len(files),
+                       issues=dict(sorted(issue_count.items())),
+                       actions=dict(sorted(action_count.items())),
+                       outputs=dict(sorted(state_count.items())))
+        self.report = dict(summary=summary, files=dict(sorted(files.items())))
+        logger.info(f"{len(files)} of {len(self.xml_list)} xml with issues: "
+                    f"{summary['issues']}")
+        return self.report
+
+    @staticmethod
+    def _collect(results, files, issue_count, action_count, state_count):
+        for xml_name, issues, state in results:
+            state_count[state] += 1
+            if not issues:
+                continue
+            files[xml_name] = issues
+            for issue in issues:
+                issue_count[issue['type']] += 1
+                if 'action' in issue:
+                    action_count[issue['action']] += 1
+
+    def save_report(self, out_path: str):
+        with open(out_path, 'w') as f:
+            json.dump(self.report, f, indent=2)
@@ -1,12 +1,144 @@
+import io
 import logging
 from pathlib import Path
-from PIL import Image
-from tqdm import tqdm
-from multiprocessing.pool import ThreadPool
+from typing import List, Union
+from functools import partial
+from contextlib import nullcontext
 from ..dataset.xml_format import XmlFormat
+from ..dataset.annotation import ImageAnnotation
+from ..dataset.coco_format import CocoWriter
+from ..utils.shard import split_shards, write_manifest
+from ..utils.checkpoint import Journal, atomic_write, journal_path
+from ..utils.profiler import Profiler, NULL_PROFILER
+from ..utils.pipeline import Pipeline
 
 logger = logging.getLogger(__name__)
-logging.basicConfig(level=logging.INFO)
+
+
+def _pixel_num(img_path: Path) -> int:
+    from PIL import Image
+    with Image.open(img_path) as img:  # only the header is read
+        return img.size[0] * img.size[1]
+
+
+def get_slice_bboxes(img_size, slice_size, overlap_size):
+    ''' get slice windows of an image
+
+    Args:
+        img_size: [tuple], (W, H)
+        slice_size: [tuple], (slice_w, slice_h)
+        overlap_size: [tuple], (overlap_w, overlap_h) in pixels
+
+    Return:
+        slice_bboxes: [list], [[x1, y1, x2, y2], ...]
+    '''
+    img_w, img_h = img_size
+    slice_w, slice_h = slice_size
+    overlap_w, overlap_h = overlap_size
+    slice_bboxes = []
+    ymax = ymin = 0
+    while ymax < img_h:
+        xmin = xmax = 0
+        ymax = ymin + slice_h
+        while xmax < img_w:
+            xmax = xmin + slice_w
+            x2 = min(img_w, xmax)
+            y2 = min(img_h, ymax)
+            x1 = max(0, x2-slice_w)
+            y1 = max(0, y2-slice_h)
+            slice_bboxes.append([x1, y1, x2, y2])
+            xmin = xmax - overlap_w
+        ymin = ymax - overlap_h
+    return slice_bboxes
+
+
+def slice_annotation(ann: ImageAnnotation, slice_bbox: list, min_area_ratio=0.2,
+                     img_name='') -> ImageAnnotation:
+    ''' objects kept in a slice, in slice coordinates
+
+    Args:
+        ann: [ImageAnnotation], annotation record of the image
+        slice_bbox: [list], [x1, y1, x2, y2] of the slice
+        min_area_ratio: [float], min ratio of object area inside the slice
+        img_name: [str], image name of the slice
+
+    Return:
+        [ImageAnnotation], record of the slice, sized as slice_bbox,
+        zero-area and inverted boxes are dropped
+    '''
+    patch_x1, patch_y1, patch_x2, patch_y2 = slice_bbox
+    # slice bboxes may be float with fractional overlap, sized as Image.crop
+    patch = ImageAnnotation(img_name, round(patch_x2)-round(patch_x1),
+                            round(patch_y2)-round(patch_y1))
+    # share the name index, so patch.groups() keeps the order of ann.groups()
+    patch.names = list(ann.names)
+    boxes = ann.boxes
+    for i, cls_id in enumerate(ann.cls_ids):
+        bx1, by1, bx2, by2 = boxes[4*i:4*i+4]
+        if bx2 <= bx1 or by2 <= by1:
+            continue  # degenerate box, see dataset.xml_validate to report them
+        bbox_area = (bx2-bx1) * (by2-by1)
+        x1 = min(patch_x2, max(patch_x1, bx1))
+        y1 = min(patch_y2, max(patch_y1, by1))
+        x2 = min(patch_x2, max(patch_x1, bx2))
+        y2 = min(patch_y2, max(patch_y1, by2))
+        area_ratio = (x2-x1)*(y2-y1) / bbox_area
+        if area_ratio < min_area_ratio:
+            continue
+        patch.cls_ids.append(cls_id)
+        patch.boxes.extend((int(x1-patch_x1), int(y1-patch_y1),
+                            int(x2-patch_x1), int(y2-patch_y1)))
+    return patch
+
+
+def _tile_offset(slice_bbox: list) -> list:
+    ''' top left of a slice in the source image, rounded as Image.crop
+    '''
+    return [round(slice_bbox[0]), round(slice_bbox[1])]
+
+
+def get_obj_with_bbox(obj_info: dict, slice_bbox: list, min_area_ratio=0.2) -> dict:
+    ''' objects kept in a slice, obj_info format of XmlFormat.parse_xml_info,
+    see slice_annotation
+    '''
+    ann = ImageAnnotation.from_legacy(None, obj_info)
+    return slice_annotation(ann, slice_bbox, min_area_ratio).to_legacy()[1]
+
+
+def _slice_bytes(payload: tuple, slice_size, overlap_size, min_area_ratio, img_format,
+                 with_xml=True):
+    ''' compute stage of ImageSlice.run_pipeline, runs in worker processes
+
+    Args:
+        payload: [tuple], (image content, xml content or None, image stem,
+                 image suffix, output directory)
+        with_xml: [bool], serialize tile annotations to xml, otherwise return
+                  the tile records
+
+    Return:
+        outputs: [list], [(output file name, content), ...] of all tiles and xml
+        tiles: [list], [(tile ImageAnnotation, (x, y) offset), ...] if not with_xml
+    '''
+    from PIL import Image
+    img_data, xml_data, stem, suffix, out_dir = payload
+    img = Image.open(io.BytesIO(img_data))
+    img.load()
+    ann = XmlFormat.parse_annotation_bytes(xml_data) if xml_data is not None else None
+    outputs, tiles = [], []
+    for i, slice_bbox in enumerate(get_slice_bboxes(img.size, slice_size, overlap_size)):
+        patch_img = img.crop(slice_bbox)
+        save_name = stem + '_' + str(i)
+        buffer = io.BytesIO()
+        patch_img.save(buffer, format=img_format)
+        outputs.append((save_name+suffix, buffer.getvalue()))
+        if ann is not None:
+            patch_ann = slice_annotation(ann, slice_bbox, min_area_ratio, save_name+suffix)
+            if not with_xml:
+                tiles.append((patch_ann, _tile_offset(slice_bbox)))
+                continue
+            xml_path = str(Path(out_dir).joinpath(save_name+'.xml'))
+            outputs.append((save_name+'.xml', XmlFormat.dumps_annotation(patch_ann, xml_path)))
+    return outputs, tiles
 
 
 class ImageSlice(object):
@@ -19,16 +151,79 @@ class ImageSlice(object):
                  slice_size=(640, 640),
                  overlap_ratio=(0.5, 0.5),
                  min_area_ratio=0.2,
-                 ext='jpg'
+                 ext='jpg',
+                 num_shards=1,
+                 shard_index=0,
+                 shard_balance=False,
+                 resume=False,
+                 profiler: Profiler=None,
+                 out_format='xml',
+                 classes: Union[str, List]=None,
+                 coco_path: str=None
                  ):
+        '''
+        Args:
+            img_dir: [str], image directory
+            out_dir: [str], output image and xml (optional) directory
+            xml_dir: [str], xml directory, default None (slice images only)
+            slice_size: [tuple], (slice_w, slice_h)
+            overlap_ratio: [tuple], overlap ratio of width and height
+            min_area_ratio: [float], min area ratio kept for objects cut by slices
+            ext: [str], image extension
+            num_shards: [int], total shard number for distributed runs, default 1
+            shard_index: [int], index of the shard processed by this instance
+            shard_balance: [bool], balance shards by image pixel number
+                           (reads all image headers), default False
+            resume: [bool], skip images finished by a previous run (see
+                    utils.checkpoint.Journal), default False
+            profiler: [Profiler], collect per-stage timing, default None (disabled)
+            out_format: [str], tile annotation format, 'xml' (one xml per tile) or
+                        'coco' (one coco json for all tiles, with parent_id,
+                        parent_file_name and offset image fields), default 'xml'
+            classes: [str | list], class list or class file, required by 'coco'
+            coco_path: [str], coco json save path, default annotations.json
+                       (annotations-shard-XXXXX-of-XXXXX.json) in out_dir
+        '''
+        from PIL import Image
         self.img_dir = Path(img_dir)
         self.out_dir = Path(out_dir)
         self.xml_dir = Path(xml_dir) if xml_dir is not None else None
         self.img_list = sorted(list(self.img_dir.glob('*.'+ext)))
+        # ids of source images, stable across shards
+        self.parent_ids = {p.name: i + 1 for i, p in enumerate(self.img_list)}
+        self.num_shards = num_shards
+        self.shard_index = shard_index
+        if num_shards > 1:
+            weights = None
+            if shard_balance:
+                weights = [_pixel_num(p) for p in self.img_list]
+            self.img_list = split_shards(self.img_list, num_shards, shard_index, weights)
         self.slice_w, self.slice_h = slice_size
         self.overlap_w = self.slice_w * overlap_ratio[0]
         self.overlap_h = self.slice_h * overlap_ratio[1]
         self.min_area_ratio = min_area_ratio
+        self.resume = resume
+        self.profiler = profiler if profiler is not None else NULL_PROFILER
+        # tiles are encoded to memory first, so pass the format to PIL
+        self.img_format = Image.registered_extensions()['.'+ext.lower()]
+        assert out_format in ('xml', 'coco'), "out_format must be 'xml' or 'coco'!"
+        self.out_format = out_format
+        self.classes = classes
+        self.coco_path = coco_path
+        self._coco = None
+        if out_format == 'coco':
+            assert xml_dir is not None, "coco output requires xml annotations!"
+            assert classes is not None, "coco output requires classes!"
+            # the coco json is streamed, it can not be continued
+            assert not resume, "resume is not supported with coco output!"
+            if isinstance(classes, str):
+                with open(classes, 'r') as f:
+                    self.classes = [line.strip() for line in f.readlines()
+                                    if not line.startswith('#')]
+            if coco_path is None:
+                name = 'annotations.json' if num_shards == 1 else \
+                    f'annotations-shard-{shard_index:05d}-of-{num_shards:05d}.json'
+                self.coco_path = str(self.out_dir.joinpath(name))
 
         if not self.out_dir.exists():
             self.out_dir.mkdir(parents=True)
@@ -38,73 +233,246 @@ class ImageSlice(object):
             assert self.xml_dir.exists(), "xml directory not found!"
 
     def _get_slice_bboxes(self, img_size):
-        img_w, img_h = img_size
-        slice_bboxes = []
-        ymax = ymin = 0
-        while ymax < img_h:
-            xmin = xmax = 0
-            ymax = ymin + self.slice_h
-            while xmax < img_w:
-                xmax = xmin + self.slice_w
-                x2 = min(img_w, xmax)
-                y2 = min(img_h, ymax)
-                x1 = max(0, x2-self.slice_w)
-                y1 = max(0, y2-self.slice_h)
-                slice_bboxes.append([x1, y1, x2, y2])
-                xmin = xmax - self.overlap_w
-            ymin = ymax - self.overlap_h
-        return slice_bboxes
+        return get_slice_bboxes(img_size, (self.slice_w, self.slice_h),
+                                (self.overlap_w, self.overlap_h))
     
     def _get_obj_with_bbox(self, obj_info: dict, slice_bbox: list):
-        patch_obj = {}
-        patch_x1, patch_y1, patch_x2, patch_y2 = slice_bbox
-        for obj_name, bboxes in obj_info.items():
-            for bbox in bboxes:
-                bbox_area = (bbox[2]-bbox[0]) * (bbox[3]-bbox[1])
-                x1 = min(patch_x2, max(patch_x1, bbox[0]))
-                y1 = min(patch_y2, max(patch_y1, bbox[1]))
-                x2 = min(patch_x2, max(patch_x1, bbox[2]))
-                y2 = min(patch_y2, max(patch_y1, bbox[3]))
-                area_ratio = (x2-x1)*(y2-y1) / bbox_area
-                if area_ratio < self.min_area_ratio:
-                    continue
-                x1 -= patch_x1
-                y1 -= patch_y1
-                x2 -= patch_x1
-                y2 -= patch_y1
-                if obj_name not in patch_obj.keys():
-                    patch_obj[obj_name] = []
-                patch_obj[obj_name].append([x1, y1, x2, y2])
-                # breakpoint()
-        return patch_obj
-    
+        return get_obj_with_bbox(obj_info, slice_bbox, self.min_area_ratio)
+
+    def _slice_annotation(self, ann: ImageAnnotation, slice_bbox: list, img_name=''):
+        return slice_annotation(ann, slice_bbox, self.min_area_ratio, img_name)
+
     def _slice_single(self, img_path: Path):
-        # 1. get patches
-        img = Image.open(img_path)
+        '''
+        Return:
+            tiles: [list], [(tile ImageAnnotation, (x, y) offset), ...] for coco
+                   output, empty for xml output
+        '''
+        from PIL import Image
+        prof = self.profiler
+        with prof.stage('decode'):
+            img = Image.open(img_path)
+            img.load()
+        if prof.enabled:
+            prof.add_bytes('file_read', img_path.stat().st_size)
+
+        ann = None
+        if self.xml_dir:
+            xml_path = self.xml_dir.joinpath(img_path.stem+'.xml')
+            with prof.stage('xml_parse'):
+                ann = XmlFormat.parse_annotation(xml_path)
+            if prof.enabled:
+                prof.add_bytes('file_read', Path(xml_path).stat().st_size)
+
+        tiles = []
         slice_bboxes = self._get_slice_bboxes(img.size)
         for i, slice_bbox in enumerate(slice_bboxes):
-            patch_img = img.crop(slice_bbox)
+            with prof.stage('crop'):
+                patch_img = img.crop(slice_bbox)
             save_name = img_path.stem + '_' + str(i)
             save_path = self.out_dir.joinpath(save_name+img_path.suffix)
-            patch_img.save(save_path)
-            
-            if self.xml_dir:
-                xml_path = self.xml_dir.joinpath(img_path.stem+'.xml')
-                _, obj_info = XmlFormat.parse_xml_info(xml_path)
-                patch_img_info = [save_name+img_path.suffix, *patch_img.size, 3]
-                patch_bboxes = self._get_obj_with_bbox(obj_info, slice_bbox)
+            with prof.stage('encode'):
+                buffer = io.BytesIO()
+                patch_img.save(buffer, format=self.img_format)
+                data = buffer.getvalue()
+            with prof.stage('file_write'):
+                atomic_write(save_path, data)
+            prof.add_bytes('file_write', len(data))
+
+            if ann is not None and self.out_format == 'coco':
+                patch_ann = self._slice_annotation(ann, slice_bbox, save_name+img_path.suffix)
+                tiles.append((patch_ann, _tile_offset(slice_bbox)))
+            elif ann is not None:
                 xml_save_path = self.out_dir.joinpath(save_name+'.xml')
-                XmlFormat.dump_xml(patch_img_info, patch_bboxes, str(xml_save_path))
+                with prof.stage('xml_dump'):
+                    patch_ann = self._slice_annotation(ann, slice_bbox, save_name+img_path.suffix)
+                    data = XmlFormat.dumps_annotation(patch_ann, str(xml_save_path))
+                with prof.stage('file_write'):
+                    atomic_write(xml_save_path, data)
+                prof.add_bytes('file_write', len(data))
+        prof.add('items')
+        return tiles
 
-    def run(self):
+    def _plan_single(self, img_path: Path, out_dir: str) -> dict:
+        from PIL import Image
+        img = Image.open(img_path)  # only the header is read
+        img_w, img_h = img.size
+        img.close()
+        # estimate tile size with the compression ratio of the source image
+        bytes_per_pixel = img_path.stat().st_size / max(1, img_w * img_h)
+        slice_bboxes = self._get_slice_bboxes((img_w, img_h))
+        tile_pixels = sum((x2-x1)*(y2-y1) for x1, y1, x2, y2 in slice_bboxes)
+        plan = dict(image=img_path.name, width=img_w, height=img_h,
+                    tile_num=len(slice_bboxes), instance_num=0,
+                    tile_pixels=int(tile_pixels),
+                    img_bytes=int(tile_pixels * bytes_per_pixel), xml_bytes=0)
+        if self.xml_dir:
+            xml_path = self.xml_dir.joinpath(img_path.stem+'.xml')
+            ann = XmlFormat.parse_annotation(xml_path)
+            name_len = len(img_path.stem) + len(img_path.suffix) + 4
+            for slice_bbox in slice_bboxes:
+                patch_ann = self._slice_annotation(ann, slice_bbox)
+                # approximate size of XmlFormat.dump_xml output
+                plan['xml_bytes'] += 150 + 2 * (len(out_dir) + name_len)
+                for obj_name, bboxes in patch_ann.groups():
+                    plan['instance_num'] += len(bboxes)
+                    plan['xml_bytes'] += len(bboxes) * (240 + len(obj_name))
+        return plan
+
+    def _calibrate(self, img_list: list) -> float:
+        ''' slice sample images into a temporary directory
+
+        Return:
+            seconds per output tile pixel
+        '''
+        import time
+        import tempfile
+        out_dir = self.out_dir
+        tile_pixels = 0
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.out_dir = Path(tmp_dir)
+            try:
+                t1 = time.time()
+                for img_path in img_list:
+                    self._slice_single(img_path)
+                    tile_pixels += self._plan_single(img_path, tmp_dir)['tile_pixels']
+                t2 = time.time()
+            finally:
+                self.out_dir = out_dir
+        return (t2 - t1) / max(1, tile_pixels)
+
+    def plan(self, sample_num=0) -> dict:
+        ''' dry run: predict tiles, annotations and bytes without writing pixels
+
+        Only image headers and xml annotations are read. Output sizes are
+        estimated from the compression ratio of each source image.
+
+        Args:
+            sample_num: [int], slice this number of images into a temporary
+                        directory to estimate the run time, default 0 (no estimate)
+
+        Return:
+            [dict], {'images': [per image plan, ...], 'total': {...}}
+        '''
+        from tqdm import tqdm
+        out_dir = str(self.out_dir.resolve())
+        images, failed = [], []
         for img_path in tqdm(self.img_list):
             try:
-                self._slice_single(img_path)
+                images.append(self._plan_single(img_path, out_dir))
             except Exception as e:
                 logger.error(e)
+                failed.append(img_path.name)
+
+        total = dict(image_num=len(images), failed=failed)
+        for key in ('tile_num', 'instance_num', 'tile_pixels', 'img_bytes', 'xml_bytes'):
+            total[key] = sum(plan[key] for plan in images)
+        total['bytes'] = total['img_bytes'] + total['xml_bytes']
+        if sample_num > 0 and len(self.img_list) > 0:
+            step = max(1, len(self.img_list) // sample_num)
+            seconds = self._calibrate(self.img_list[::step][:sample_num])
+            total['seconds'] = seconds * total['tile_pixels']
+        return dict(images=images, total=total)
+
+    def _open_journal(self) -> Journal:
+        return Journal(journal_path(self.out_dir, self.num_shards, self.shard_index),
+                       self.resume)
+
+    def _finish(self, done):
+        if self.num_shards > 1:
+            write_manifest(str(self.out_dir), self.num_shards, self.shard_index, done)
+
+    def _open_coco(self):
+        if self.out_format != 'coco':
+            return nullcontext()
+        self._coco = CocoWriter(self.coco_path, self.classes)
+        return self._coco
+
+    def _add_coco(self, img_path: Path, tiles: list):
+        ''' append tiles of a source image to the coco writer
+        '''
+        if self._coco is None:
+            return
+        with self.profiler.stage('coco_dump'):
+            for patch_ann, offset in tiles:
+                self._coco.add_image(patch_ann, parent_id=self.parent_ids[img_path.name],
+                                     parent_file_name=img_path.name, offset=offset)
+
+    def _close_coco(self):
+        if self._coco is not None:
+            self._coco.close()
+            logger.info(f"{self._coco.img_num} tiles, {self._coco.obj_num} objects "
+                        f"saved to {self.coco_path}")
+            self._coco = None
+
+    def run(self):
+        from tqdm import tqdm
+        with self._open_journal() as journal, self._open_coco():
+            for img_path in tqdm(journal.todo(self.img_list)):
+                try:
+                    tiles = self._slice_single(img_path)
+                    self._add_coco(img_path, tiles)
+                    journal.add(img_path)
+                except Exception as e:
+                    logger.error(e)
+            self._finish(journal.done)
+            self._close_coco()
 
     def run_thread(self, threads=4):
-        with ThreadPool(threads) as p:
-            return list(tqdm(p.imap(self._slice_single, self.img_list), total=len(self.img_list)))
+        from tqdm import tqdm
+        from multiprocessing.pool import ThreadPool
+        with self._open_journal() as journal, self._open_coco():
+            img_list = journal.todo(self.img_list)
+            results = []
+            with ThreadPool(threads) as p:
+                # imap keeps the input order, so coco ids are deterministic
+                for img_path, tiles in zip(img_list, tqdm(
+                        p.imap(self._slice_single, img_list), total=len(img_list))):
+                    self._add_coco(img_path, tiles)
+                    journal.add(img_path)
+                    results.append(True)
+            self._finish(journal.done)
+            self._close_coco()
+        return results
+
+    def _read(self, img_path: Path) -> tuple:
+        with self.profiler.stage('file_read'):
+            img_data = img_path.read_bytes()
+            xml_data = None
+            if self.xml_dir:
+                xml_data = self.xml_dir.joinpath(img_path.stem+'.xml').read_bytes()
+        self.profiler.add_bytes('file_read', len(img_data) + len(xml_data or b''))
+        return img_data, xml_data, img_path.stem, img_path.suffix, str(self.out_dir)
+
+    def _write(self, img_path: Path, result: tuple):
+        outputs, tiles = result
+        for name, data in outputs:
+            with self.profiler.stage('file_write'):
+                atomic_write(self.out_dir.joinpath(name), data)
+            self.profiler.add_bytes('file_write', len(data))
+        self._add_coco(img_path, tiles)
 
+    def run_pipeline(self, readers=2, workers=2, writers=4, queue_size=8, processes=True,
+                     executor=None):
+        ''' overlap image reading, slicing (decode, crop, encode in processes)
+        and tile writing, see utils.pipeline.Pipeline
 
+        queue_size bounds the number of images (with all their tiles) in memory.
+        With coco output, ids follow the write order of the writer threads.
+        executor is an optional shared compute pool.
+        '''
+        from tqdm import tqdm
+        compute_fn = partial(_slice_bytes, slice_size=(self.slice_w, self.slice_h),
+                             overlap_size=(self.overlap_w, self.overlap_h),
+                             min_area_ratio=self.min_area_ratio, img_format=self.img_format,
+                             with_xml=self.out_format == 'xml')
+        pipeline = Pipeline(self._read, compute_fn, self._write, readers, workers, writers,
+                            queue_size, write_batch=1, compute_batch=1, processes=processes,
+                            executor=executor)
+        with self._open_journal() as journal, self._open_coco():
+            img_list = journal.todo(self.img_list)
+            with tqdm(total=len(img_list)) as progress:
+                failed = pipeline.run(img_list, journal.add_many, progress)
+            self._finish(journal.done)
+            self._close_coco()
+        return failed
@@ -0,0 +1,137 @@
+import logging
+import itertools
+import numpy as np
+from typing import List, Dict
+from .image_slice import get_slice_bboxes
+from ..dataset.xml_stats import XmlStatistics
+
+logger = logging.getLogger(__name__)
+
+
+def wh_iou(wh1: np.ndarray, wh2: np.ndarray) -> np.ndarray:
+    ''' IoU of boxes aligned at the same center
+
+    Args:
+        wh1: [np.ndarray], (N, 2)
+        wh2: [np.ndarray], (K, 2)
+
+    Return:
+        [np.ndarray], (N, K)
+    '''
+    inter = np.minimum(wh1[:, None, 0], wh2[None, :, 0]) * \
+        np.minimum(wh1[:, None, 1], wh2[None, :, 1])
+    area1 = (wh1[:, 0] * wh1[:, 1])[:, None]
+    area2 = (wh2[:, 0] * wh2[:, 1])[None, :]
+    return inter / (area1 + area2 - inter)
+
+
+def kmeans_anchors(wh: np.ndarray, k=9, max_iter=300, seed=0):
+    ''' k-means clustering of box sizes with 1 - IoU distance
+
+    Args:
+        wh: [np.ndarray], (N, 2) box width and height, N >= k
+        k: [int], anchor number
+        max_iter: [int], max iteration number
+        seed: [int], random seed of initial centers
+
+    Return:
+        anchors: [np.ndarray], (k, 2) sorted by area
+        mean_iou: [float], mean best IoU between boxes and anchors
+    '''
+    assert len(wh) >= k, f"box number {len(wh)} less than anchor number {k}!"
+    rng = np.random.default_rng(seed)
+    centers = wh[rng.choice(len(wh), k, replace=False)].astype(np.float64)
+    assign = np.full(len(wh), -1)
+    for _ in range(max_iter):
+        new_assign = wh_iou(wh, centers).argmax(axis=1)
+        if (new_assign == assign).all():
+            break
+        assign = new_assign
+        for i in range(k):
+            members = wh[assign == i]
+            if len(members):
+                centers[i] = np.median(members, axis=0)
+    centers = centers[np.argsort(centers.prod(axis=1))]
+    mean_iou = float(wh_iou(wh, centers).max(axis=1).mean())
+    return centers, mean_iou
+
+
+class SliceSearch(object):
+    ''' recommend anchors and slice settings for ImageSlice without slicing
+
+    Boxes are loaded once with XmlStatistics, then each candidate
+    (slice_size, overlap_ratio) is simulated with the same windows and
+    min_area_ratio rule as ImageSlice, no image is read or written.
+    '''
+
+    def __init__(self, xml_dir: str, processes=4):
+        self.stats = XmlStatistics(xml_dir, processes).load()
+        box_w = self.stats.boxes[:, 2] - self.stats.boxes[:, 0]
+        box_h = self.stats.boxes[:, 3] - self.stats.boxes[:, 1]
+        valid = (box_w > 0) & (box_h > 0)
+        if not valid.all():
+            logger.warning(f"{(~valid).sum()} degenerate boxes ignored")
+        self.boxes = self.stats.boxes[valid]
+        self.img_ids = self.stats.img_ids[valid]
+
+        # group boxes by image once for all simulations
+        order = np.argsort(self.img_ids, kind='stable')
+        self.boxes = self.boxes[order]
+        self.img_ids = self.img_ids[order]
+        img_num = len(self.stats.img_sizes)
+        self.starts = np.searchsorted(self.img_ids, np.arange(img_num), 'left')
+        self.ends = np.searchsorted(self.img_ids, np.arange(img_num), 'right')
+
+    def anchors(self, k=9, max_iter=300, seed=0):
+        ''' see kmeans_anchors
+        '''
+        wh = np.stack([self.boxes[:, 2] - self.boxes[:, 0],
+                       self.boxes[:, 3] - self.boxes[:, 1]], axis=1)
+        return kmeans_anchors(wh, k, max_iter, seed)
+
+    def simulate(self, slice_size=(640, 640), overlap_ratio=(0.5, 0.5),
+                 min_area_ratio=0.2) -> Dict:
+        ''' simulate ImageSlice with given settings
+
+        Return:
+            [dict], tile_num: slice number
+                    instance_num: object instances written to all slices
+                    cut_num: instances only partly inside its slice
+                    dropped_num: (object, slice) pairs dropped by min_area_ratio
+                    lost_num: objects not kept by any slice
+                    object_num: valid objects in dataset
+        '''
+        slice_w, slice_h = slice_size
+        overlap = (slice_w * overlap_ratio[0], slice_h * overlap_ratio[1])
+        window_cache = {}
+        result = dict(slice_size=list(slice_size), overlap_ratio=list(overlap_ratio),
+                      min_area_ratio=min_area_ratio, tile_num=0, instance_num=0,
+                      cut_num=0, dropped_num=0, lost_num=0, object_num=len(self.boxes))
+        for img_id, (img_w, img_h) in enumerate(self.stats.img_sizes.tolist()):
+            if (img_w, img_h) not in window_cache:
+                window_cache[(img_w, img_h)] = np.array(
+                    get_slice_bboxes((img_w, img_h), slice_size, overlap), dtype=np.float64)
+            windows = window_cache[(img_w, img_h)]
+            result['tile_num'] += len(windows)
+            boxes = self.boxes[self.starts[img_id]:self.ends[img_id]]
+            if len(boxes) == 0:
+                continue
+            # (B, S) clipped box area inside each window
+            x1 = np.clip(boxes[:, None, 0], windows[None, :, 0], windows[None, :, 2])
+            y1 = np.clip(boxes[:, None, 1], windows[None, :, 1], windows[None, :, 3])
+            x2 = np.clip(boxes[:, None, 2], windows[None, :, 0], windows[None, :, 2])
+            y2 = np.clip(boxes[:, None, 3], windows[None, :, 1], windows[None, :, 3])
+            area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+            ratio = (x2 - x1) * (y2 - y1) / area[:, None]
+            keep = ratio >= min_area_ratio
+            result['instance_num'] += int(keep.sum())
+            result['cut_num'] += int((keep & (ratio < 1)).sum())
+            result['dropped_num'] += int(((ratio > 0) & ~keep).sum())
+            result['lost_num'] += int((~keep.any(axis=1)).sum())
+        return result
+
+    def sweep(self, slice_sizes: List, overlap_ratios: List, min_area_ratio=0.2) -> List[Dict]:
+        ''' simulate all combinations of slice sizes and overlap ratios
+        '''
+        return [self.simulate(size, overlap, min_area_ratio)
+                for size, overlap in itertools.product(slice_sizes, overlap_ratios)]
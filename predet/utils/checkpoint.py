@@ -0,0 +1,115 @@
+import os
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from typing import List
+
+
+@contextmanager
+def atomic_path(path: str):
+    ''' yield a temporary path next to `path`, renamed to `path` on success
+
+    A crash never leaves a half written output behind, only a *.tmp file.
+    The temporary suffix is not the output suffix, so pass the file format
+    explicitly when the writer infers it from the extension (e.g. PIL).
+    '''
+    path = str(path)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def journal_path(out_dir: str, num_shards=1, shard_index=0) -> Path:
+    ''' journal path in output directory, one journal per shard
+    '''
+    if num_shards == 1:
+        return Path(out_dir).joinpath('predet.journal')
+    return Path(out_dir).joinpath(f'shard-{shard_index:05d}-of-{num_shards:05d}.journal')
+
+
+def atomic_write(path: str, data: bytes):
+    ''' write bytes to path through a temporary file
+    '''
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+
+
+class Journal(object):
+    ''' append-only journal of finished inputs for resumable runs
+
+    One input name per line, flushed after each record. A partially
+    written last line (crash during write) is ignored when resuming.
+
+    The journal file is only written with resume=True (created if missing),
+    so runs that are not resumable leave no file in the output directory.
+    Pass resume from the first run to be able to continue it after a crash.
+    '''
+
+    def __init__(self, journal_path: str, resume=False):
+        '''
+        Args:
+            journal_path: [str], journal file path
+            resume: [bool], load finished inputs from an existing journal and
+                    append to it, otherwise only track finished inputs in memory
+        '''
+        self.journal_path = Path(journal_path)
+        self.done = set()
+        if resume and self.journal_path.exists():
+            size = 0
+            with self.journal_path.open('rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    size += len(line)
+                    if len(line) > 1:
+                        self.done.add(line[:-1].decode('utf-8'))
+            # drop a partial last line, it is not a finished input
+            os.truncate(self.journal_path, size)
+        self._lock = threading.Lock()
+        self._f = self.journal_path.open('a', encoding='utf-8') if resume else None
+
+    @staticmethod
+    def key(item) -> str:
+        return Path(str(item)).name
+
+    def __contains__(self, item) -> bool:
+        return self.key(item) in self.done
+
+    def todo(self, items: List) -> List:
+        ''' items not finished yet
+        '''
+        return [item for item in items if self.key(item) not in self.done]
+
+    def add(self, item):
+        key = self.key(item)
+        with self._lock:
+            if self._f is not None:
+                self._f.write(key + '\n')
+                self._f.flush()
+            self.done.add(key)
+
+    def add_many(self, items: List):
+        keys = [self.key(item) for item in items]
+        with self._lock:
+            if self._f is not None:
+                self._f.write(''.join(key + '\n' for key in keys))
+                self._f.flush()
+            self.done.update(keys)
+
+    def close(self):
+        with self._lock:
+            if self._f is not None and not self._f.closed:
+                self._f.flush()
+                os.fsync(self._f.fileno())
+                self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
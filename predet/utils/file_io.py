@@ -6,36 +6,104 @@
 import os
 import shutil
 import hashlib
-from tqdm import tqdm
+from .checkpoint import atomic_path
 
 
-def get_file_path(file_dir, filter=[], sort=False):
+def _iter_dir(dir_path, ext_set, sub_dirs):
+    ''' 逐个返回单个文件夹（不递归）中匹配的文件路径，子文件夹路径添加到sub_dirs
+    '''
+    try:
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    continue
+                if is_dir:
+                    # 与os.walk一致，不进入软链接文件夹
+                    if not entry.is_symlink():
+                        sub_dirs.append(entry.path)
+                    continue
+                if ext_set:
+                    name = entry.name
+                    idx = name.rfind('.')
+                    if idx <= 0 or name[idx:] not in ext_set:
+                        continue
+                yield entry.path
+    except OSError as e:
+        print("scan failed for {}: {}".format(dir_path, e))
+
+
+def _scan_dir(dir_path, ext_set):
+    ''' 扫描单个文件夹（不递归），返回匹配的文件路径列表及子文件夹列表
+    '''
+    sub_dirs = []
+    files = list(_iter_dir(dir_path, ext_set, sub_dirs))
+    return files, sub_dirs
+
+
+def iter_file_path(file_dir, filter=[], workers=1, recursive=True):
+    ''' 以生成器形式遍历文件夹（包括子文件夹）下指定扩展名的文件路径
+
+    基于os.scandir实现，边遍历边返回结果（单线程时逐个文件返回），
+    调用方无需等待遍历结束即可开始处理。
+    workers大于1时使用线程池并行遍历子文件夹（适用于NFS等高延迟存储），
+    此时返回顺序不确定。
+    文件夹不存在时在调用时立即抛出FileNotFoundError，无法读取的子文件夹
+    仅打印提示并跳过。
+
+    Args:
+        file_dir: [str]，需要遍历的文件夹路径
+        filter: [str list], 指定需要返回的扩展名列表，如'.txt', 若不指定，则返回所有文件路径
+        workers: [int], 并行遍历的线程数，默认1
+        recursive: [bool], 是否遍历子文件夹，默认True
+
+    Return:
+        generator，依次返回匹配的文件路径
+    '''
+    if not os.path.isdir(file_dir):
+        raise FileNotFoundError("no exist file directory: %s" % file_dir)
+    return _iter_file_path(file_dir, set(filter), workers, recursive)
+
+
+def _iter_file_path(file_dir, ext_set, workers, recursive):
+    if workers <= 1 or not recursive:
+        stack = [file_dir]
+        while stack:
+            sub_dirs = []
+            yield from _iter_dir(stack.pop(), ext_set, sub_dirs)
+            if recursive:
+                stack.extend(reversed(sub_dirs))
+        return
+
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    with ThreadPoolExecutor(workers) as executor:
+        pending = {executor.submit(_scan_dir, file_dir, ext_set)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, sub_dirs = future.result()
+                for sub_dir in sub_dirs:
+                    pending.add(executor.submit(_scan_dir, sub_dir, ext_set))
+                yield from files
+
+
+def get_file_path(file_dir, filter=[], sort=False, workers=1):
     ''' 获取文件夹下文件路径列表
 
     遍历指定文件夹（包括子文件夹）下所有指定扩展名的文件路径，
-    
+    文件夹不存在时抛出FileNotFoundError
+
     Args:
         file_dir: [str]，需要遍历的文件夹路径
         filter: [str list], 指定需要返回的扩展名列表，如'.txt', 若不指定，则返回所有文件路径
         sort: [bool], 是否对遍历结果进行排序（升序）
+        workers: [int], 并行遍历的线程数，默认1，见iter_file_path
 
     Return:
         file_list: [str list]，包含所有指定扩展名的文件列表
     '''
-    result=[]
-
-    if not os.path.isdir(file_dir):
-        print("no exist file directory: %s" % file_dir)
-
-    for maindir, _, file_name_list in os.walk(file_dir):
-        for filename in file_name_list:
-            ext=os.path.splitext(filename)[-1]
-            if filter == []:
-                result.append(os.path.join(maindir,filename))
-                continue
-            elif ext in filter:
-                result.append(os.path.join(maindir,filename))
-
+    result = list(iter_file_path(file_dir, filter, workers))
     if sort is True:
         result.sort()
     return result
@@ -92,21 +160,97 @@ def write_list_to_txt(str_list, txt_path):
         f.write('\n'.join(list(map(str, str_list))))
 
 
-def copy_with_list(path_list, dst_dir):
+def _reflink(src, dst):
+    '''Linux下通过FICLONE创建写时复制副本（btrfs, xfs等），不支持时抛出OSError
+    '''
+    import fcntl
+    FICLONE = 0x40049409
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    shutil.copystat(src, dst)
+
+
+def _copy_single(src, dst_dir, link=None, skip_existing=False):
+    '''拷贝单个文件
+
+    Return:
+        (拷贝方式, 字节数), 拷贝方式为'skip', 'hardlink', 'reflink', 'copy'之一
+    '''
+    dst = os.path.join(dst_dir, os.path.basename(src))
+    src_stat = os.stat(src)
+    if os.path.exists(dst):
+        # 与shutil.copy一致，不拷贝到自身（源文件已在目标文件夹中或已硬链接）
+        if os.path.samefile(src, dst):
+            return 'skip', 0
+        dst_stat = os.stat(dst)
+        if skip_existing and dst_stat.st_size == src_stat.st_size and \
+                int(dst_stat.st_mtime) == int(src_stat.st_mtime):
+            return 'skip', 0
+
+    # 先链接或拷贝到临时文件，成功后再替换dst，失败时dst保持不变
+    mode = 'copy'
+    with atomic_path(dst) as tmp_path:
+        if link == 'hardlink':
+            try:
+                os.link(src, tmp_path)
+                mode = 'hardlink'
+            except OSError:
+                pass
+        elif link == 'reflink':
+            try:
+                _reflink(src, tmp_path)
+                mode = 'reflink'
+            except OSError:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        if mode == 'copy':
+            # copy2在Linux下使用sendfile在内核中拷贝，并保留修改时间供skip_existing判断
+            shutil.copy2(src, tmp_path)
+    return mode, src_stat.st_size
+
+
+def copy_with_list(path_list, dst_dir, workers=1, link=None, skip_existing=False):
     '''根据路径列表拷贝文件
 
     Args:
         path_list: [str], 待拷贝的文件路径列表
         dst_dir: [str], 拷贝的目标文件夹
+        workers: [int], 拷贝线程数，默认1
+        link: [str], None（拷贝）, 'hardlink'或'reflink'，
+              源文件与目标文件夹不在同一文件系统或不支持时自动退回拷贝
+        skip_existing: [bool], 跳过目标文件夹中大小及修改时间均相同的文件
+
+    Return:
+        stats: [dict], 各拷贝方式的文件数、失败数、字节数及耗时
     '''
+    from tqdm import tqdm
+    import time
+    from multiprocessing.pool import ThreadPool
+
     if not os.path.exists(dst_dir):
         os.makedirs(dst_dir)
-    for path in tqdm(path_list):
+
+    def _copy(path):
         try:
-            shutil.copy(path, dst_dir)
+            return _copy_single(path, dst_dir, link, skip_existing)
         except Exception as e:
             print("copy failed for {}".format(path))
             print(e)
+            return 'failed', 0
+
+    stats = dict(copy=0, hardlink=0, reflink=0, skip=0, failed=0, bytes=0)
+    t1 = time.time()
+    with ThreadPool(max(1, workers)) as p:
+        for mode, size in tqdm(p.imap_unordered(_copy, path_list), total=len(path_list)):
+            stats[mode] += 1
+            stats['bytes'] += size
+    stats['seconds'] = time.time() - t1
+    seconds = max(stats['seconds'], 1e-6)
+    print("{} files ({:.1f} MB) in {:.1f}s: {:.1f} files/s, {:.1f} MB/s, {}".format(
+        len(path_list), stats['bytes'] / 1024**2, stats['seconds'],
+        len(path_list) / seconds, stats['bytes'] / 1024**2 / seconds,
+        {k: v for k, v in stats.items() if k not in ('bytes', 'seconds')}))
+    return stats
 
 
 def remove_file(file_path, trash_dir='./trash_dir'):
@@ -140,12 +284,50 @@ def remove_file(file_path, trash_dir='./trash_dir'):
     print("move file to {}".format(file_trash_path))
 
 
+HASH_CHUNK_SIZE = 1024 * 1024
+HASH_TRUNC_SIZE = 64 * 1024
+
+
+def get_file_hash(file_path, algorithm='md5', trunc=False, chunk_size=HASH_CHUNK_SIZE):
+    '''分块读取并计算文件哈希值
+
+    Args:
+        file_path: [str], 文件路径
+        algorithm: [str], 哈希算法，如'md5', 'sha1', 'blake2b'
+        trunc: [bool], 是否只取文件大小及头、中、尾各64kb数据进行计算（文件较大时速度更快），
+               只在文件大于192kb时起作用
+        chunk_size: [int], 每次读取的字节数
+
+    Return:
+        [str], 文件哈希值
+
+    Exception:
+        文件不存在时，抛出AssertionError
+    '''
+    assert os.path.exists(file_path), "{0} does not exist!".format(file_path)
+
+    m = hashlib.new(algorithm)
+    file_size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:  # 使用二进制格式读取文件内容
+        if trunc and file_size > 3 * HASH_TRUNC_SIZE:
+            m.update(str(file_size).encode())
+            m.update(f.read(HASH_TRUNC_SIZE))
+            f.seek((file_size - HASH_TRUNC_SIZE) // 2)
+            m.update(f.read(HASH_TRUNC_SIZE))
+            f.seek(-HASH_TRUNC_SIZE, 2)
+            m.update(f.read(HASH_TRUNC_SIZE))
+        else:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                m.update(chunk)
+    return m.hexdigest()
+
+
 def get_md5(file_path, trunc=False):
     '''获取文件md5值
 
     Args:
         file_path: [str], 文件路径
-        trunc: [bool], 是否只取前后部分数据进行计算（文件较大时速度更快）,只在文件大于100kb时起作用
+        trunc: [bool], 是否只取部分数据进行计算（文件较大时速度更快），见get_file_hash
 
     Return:
         [str], 文件md5值
@@ -153,19 +335,101 @@ def get_md5(file_path, trunc=False):
     Exception:
         文件不存在时，抛出AssertionError
     '''
-    assert os.path.exists(file_path), "{0} does not exist!".format(file_path)
+    return get_file_hash(file_path, 'md5', trunc)
 
-    m = hashlib.md5()
-    a_file = open(file_path, 'rb') # 使用二进制格式读取文件内容
-    file_size = os.path.getsize(file_path)/1024
-    if file_size > 100 and trunc==True:
-        m.update(a_file.read(100))
-        a_file.seek(-100,2)
-        m.update(a_file.read())
-    else:
-        m.update(a_file.read())
-        a_file.close()
-    return m.hexdigest()
+
+class HashCache(object):
+    ''' 基于sqlite的文件哈希缓存
+
+    以(路径, 文件大小, 修改时间)作为校验，文件未改变时直接返回缓存的哈希值，
+    用于重复执行数据集去重等任务时跳过未修改的文件。
+    '''
+    def __init__(self, db_path):
+        import sqlite3
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS file_hash ('
+            'path TEXT, algorithm TEXT, trunc INTEGER, size INTEGER, '
+            'mtime INTEGER, digest TEXT, PRIMARY KEY (path, algorithm, trunc))')
+
+    def get(self, path, algorithm, trunc, size, mtime):
+        ''' 返回缓存的哈希值，未命中或文件已修改时返回None
+        '''
+        row = self.conn.execute(
+            'SELECT size, mtime, digest FROM file_hash '
+            'WHERE path=? AND algorithm=? AND trunc=?',
+            (path, algorithm, int(trunc))).fetchone()
+        if row is None or row[0] != size or row[1] != mtime:
+            return None
+        return row[2]
+
+    def put_many(self, rows):
+        ''' 批量写入缓存
+
+        Args:
+            rows: [list], [(path, algorithm, trunc, size, mtime, digest), ...]
+        '''
+        self.conn.executemany(
+            'INSERT OR REPLACE INTO file_hash VALUES (?, ?, ?, ?, ?, ?)',
+            [(p, a, int(t), s, m, d) for p, a, t, s, m, d in rows])
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def get_hash_list(path_list, algorithm='md5', trunc=False, workers=4, cache=None):
+    '''并行计算文件列表的哈希值
+
+    hashlib在计算较大数据块时会释放GIL，因此使用线程池即可并行。
+
+    Args:
+        path_list: [str list], 文件路径列表
+        algorithm: [str], 哈希算法，见get_file_hash
+        trunc: [bool], 是否只取部分数据进行计算，见get_file_hash
+        workers: [int], 线程数
+        cache: [HashCache], 哈希缓存，默认None（不使用缓存）
+
+    Return:
+        [str list], 与path_list一一对应的哈希值
+    '''
+    from tqdm import tqdm
+    from multiprocessing.pool import ThreadPool
+
+    result = [None] * len(path_list)
+    todo = []
+    for i, path in enumerate(path_list):
+        if cache is not None:
+            st = os.stat(path)
+            key = (os.path.abspath(path), algorithm, trunc, st.st_size, st.st_mtime_ns)
+            result[i] = cache.get(*key)
+            if result[i] is not None:
+                continue
+            todo.append((i, key))
+        else:
+            todo.append((i, None))
+
+    def _hash(item):
+        return get_file_hash(path_list[item[0]], algorithm, trunc)
+
+    with ThreadPool(max(1, workers)) as p:
+        digests = list(tqdm(p.imap(_hash, todo), total=len(todo)))
+
+    rows = []
+    for (i, key), digest in zip(todo, digests):
+        result[i] = digest
+        if key is not None:
+            rows.append(key + (digest, ))
+    if cache is not None and rows:
+        cache.put_many(rows)
+    return result
 
 
 def make_dirs(dirname):
@@ -173,26 +437,98 @@ def make_dirs(dirname):
         os.makedirs(dirname)
 
 
-def compare_file_dir(dir1, dir2, result_txt, ext=['.xml', '.jpg']):
+def find_duplicate_files(path_list, algorithm='md5', workers=4, cache=None):
+    '''根据文件内容查找重复文件
+
+    依次按文件大小、部分哈希（见get_file_hash的trunc）、完整哈希分组，
+    每一步只保留仍有重复的分组，尽量减少需要完整读取的文件数量。
+
+    Args:
+        path_list: [str list], 文件路径列表
+        algorithm: [str], 哈希算法，见get_file_hash
+        workers: [int], 计算哈希的线程数
+        cache: [HashCache], 哈希缓存，默认None
+
+    Return:
+        [dict], {哈希值: [重复文件路径列表], ...}，只包含2个及以上文件的分组，
+        指向同一真实路径的输入只计一次
+    '''
+    def _group_by(paths, keys):
+        groups = {}
+        for path, key in zip(paths, keys):
+            groups.setdefault(key, []).append(path)
+        return groups
+
+    # 同一文件（重复传入、文件夹嵌套、软链接）只保留第一次出现的路径，避免与自身重复
+    seen, unique = set(), []
+    for path in path_list:
+        real = os.path.realpath(path)
+        if real not in seen:
+            seen.add(real)
+            unique.append(path)
+    path_list = unique
+
+    small, large = [], []
+    sizes = [os.path.getsize(p) for p in path_list]
+    for size, group in _group_by(path_list, sizes).items():
+        if len(group) < 2:
+            continue
+        # 小文件的部分哈希即完整哈希，无需先计算部分哈希
+        if size <= 3 * HASH_TRUNC_SIZE:
+            small.extend(group)
+        else:
+            large.extend(group)
+
+    trunc_digests = get_hash_list(large, algorithm, True, workers, cache)
+    large = [p for g in _group_by(large, trunc_digests).values() if len(g) > 1 for p in g]
+
+    candidates = small + large
+    digests = get_hash_list(candidates, algorithm, False, workers, cache)
+    return {digest: sorted(group) for digest, group in _group_by(candidates, digests).items()
+            if len(group) > 1}
+
+
+def compare_file_dir(dir1, dir2, result_txt, ext=['.xml', '.jpg'], by_content=False,
+                     workers=4):
     '''
 
     查找dir2中与dir1下指定扩展名的同名文件，
     并将dir2中重复的文件名写到result_txt
 
-    不支持文件夹递归比较！
+    by_content为False时不支持文件夹递归比较！
 
     Args:
         dir1, dir2: 待比较的两个文件夹路径
         result_txt: dir2中重复文件名
         ext: 指定的扩展名列表
+        by_content: 是否按文件内容比较（递归遍历，可找出不同文件名的重复文件），
+                    此时返回及写入的是dir2中重复文件的路径
+        workers: by_content为True时计算哈希的线程数
 
     Return:
         same_files: dir2中重复的文件名列表
     '''
+    if by_content:
+        file_list1 = get_file_path(dir1, ext)
+        file_list2 = get_file_path(dir2, ext)
+        # 按真实路径比较，dir2位于dir1中时文件不与自身重复
+        real1 = set(map(os.path.realpath, file_list1))
+        real2 = {os.path.realpath(p): p for p in file_list2}
+        same_files = set()
+        duplicates = find_duplicate_files(file_list1 + file_list2, workers=workers)
+        for group in duplicates.values():
+            reals = [os.path.realpath(p) for p in group]
+            for real in reals:
+                if real in real2 and any(r != real and r in real1 for r in reals):
+                    same_files.add(real2[real])
+        same_files = sorted(same_files)
+        write_list_to_txt(same_files, result_txt)
+        return same_files
+
     file_list1 = list(map(os.path.basename, get_file_path(dir1, ext)))
     file_list2 = list(map(os.path.basename, get_file_path(dir2, ext)))
 
     same_files = sorted(list(set(file_list1) & set(file_list2)))
     write_list_to_txt(same_files, result_txt)
 
-    return same_files
\ No newline at end of file
+    return same_files
@@ -0,0 +1,251 @@
+import queue
+import logging
+import threading
+from functools import partial
+from contextlib import nullcontext
+from typing import Callable, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+def _compute_many(compute_fn: Callable, payloads: List) -> List:
+    ''' run compute_fn over a batch in one task, keep per-item errors
+    '''
+    results = []
+    for payload in payloads:
+        try:
+            results.append((True, compute_fn(payload)))
+        except Exception as e:
+            results.append((False, e))
+    return results
+
+
+class Pipeline(object):
+    ''' staged read -> compute -> write pipeline with bounded queues
+
+    reader threads:  payload = read_fn(item)           (I/O bound)
+    compute pool:    result = compute_fn(payload)      (CPU bound, processes)
+    writer threads:  write_fn(item, result)            (I/O bound)
+
+    At most `queue_size` items are read but not yet written, so slow
+    stages apply backpressure instead of growing memory. compute_fn is
+    sent to worker processes with every task, so it should be a module
+    level function (or functools.partial of one) with small arguments.
+    A failed item is logged and skipped, like the run() loops do. An error
+    outside of the items (the items iterator, on_done, the compute pool)
+    stops all stages and is raised by run() once they have drained.
+
+    Pass an executor to share one worker pool between several runs (e.g. all
+    jobs of a job file), so workers start once. It is not shut down by run().
+
+    example:
+        pipeline = Pipeline(Path.read_bytes, partial(convert, classes=classes), save)
+        failed = pipeline.run(xml_list, on_done=journal.add_many)
+    '''
+
+    def __init__(self,
+                 read_fn: Callable,
+                 compute_fn: Callable,
+                 write_fn: Callable,
+                 readers=4,
+                 workers=2,
+                 writers=2,
+                 queue_size=64,
+                 write_batch=16,
+                 compute_batch=8,
+                 processes=True,
+                 executor=None):
+        '''
+        Args:
+            read_fn: [callable], item -> payload
+            compute_fn: [callable], payload -> result
+            write_fn: [callable], (item, result) -> None
+            readers: [int], reader thread number
+            workers: [int], compute worker number
+            writers: [int], writer thread number
+            queue_size: [int], max items in flight between reading and writing
+            write_batch: [int], max items handled by a writer before on_done
+            compute_batch: [int], max items sent to a worker in one task, which
+                           amortizes inter-process overhead for small items
+            processes: [bool], compute in processes, otherwise threads (for
+                       compute_fn releasing the GIL, e.g. image codecs)
+            executor: [Executor], shared compute pool, default None (a pool
+                      of workers is created per run, see processes)
+        '''
+        self.read_fn = read_fn
+        self.compute_fn = compute_fn
+        self.write_fn = write_fn
+        self.readers = max(1, readers)
+        self.workers = max(1, workers)
+        self.writers = max(1, writers)
+        self.queue_size = max(1, queue_size)
+        self.write_batch = max(1, write_batch)
+        self.compute_batch = max(1, compute_batch)
+        self.processes = processes
+        self.executor = executor
+
+    def _executor(self):
+        if self.executor is not None:
+            return nullcontext(self.executor)
+        # imported here, concurrent.futures.process pulls in multiprocessing
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+        executor_cls = ProcessPoolExecutor if self.processes else ThreadPoolExecutor
+        return executor_cls(self.workers)
+
+    def run(self, items: Iterable, on_done: Callable=None, progress=None) -> List:
+        ''' run all items through the pipeline
+
+        Args:
+            items: [iterable], inputs
+            on_done: [callable], called with a list of written items (one
+                     writer batch), e.g. Journal.add_many
+            progress: [tqdm], optional progress bar updated per written item
+
+        Return:
+            failed: [list], items failed in any stage
+        '''
+        item_q = queue.Queue(self.queue_size)
+        read_q = queue.Queue(self.queue_size)
+        write_q = queue.Queue()
+        in_flight = threading.BoundedSemaphore(self.queue_size)
+        failed = []
+        errors = []  # first entry is raised by run()
+        aborted = threading.Event()
+        lock = threading.Lock()
+
+        def fail(item, e):
+            logger.error(f"{item}: {e}")
+            with lock:
+                failed.append(item)
+
+        def abort(e):
+            # stages keep draining their queues without doing work, so every
+            # in_flight slot is released and the stops reach every thread
+            logger.error(f"pipeline aborted: {e!r}")
+            with lock:
+                errors.append(e)
+            aborted.set()
+
+        def feed():
+            try:
+                for item in items:
+                    in_flight.acquire()
+                    if aborted.is_set():
+                        in_flight.release()
+                        break
+                    item_q.put(item)
+            except Exception as e:
+                abort(e)
+            finally:
+                for _ in range(self.readers):
+                    item_q.put(_STOP)
+
+        def read():
+            while True:
+                item = item_q.get()
+                if item is _STOP:
+                    read_q.put(_STOP)
+                    return
+                if aborted.is_set():
+                    in_flight.release()
+                    continue
+                try:
+                    read_q.put((item, self.read_fn(item)))
+                except Exception as e:
+                    fail(item, e)
+                    in_flight.release()
+
+        def write():
+            while True:
+                batch = [write_q.get()]
+                # take at most one stop, the others belong to other writers
+                while len(batch) < self.write_batch and batch[-1] is not _STOP:
+                    try:
+                        batch.append(write_q.get_nowait())
+                    except queue.Empty:
+                        break
+                stop = batch[-1] is _STOP
+                entries = [entry for entry in batch if entry is not _STOP]
+                done = []
+                for item, ok, result in entries:
+                    try:
+                        if aborted.is_set():
+                            continue
+                        if not ok:
+                            raise result
+                        self.write_fn(item, result)
+                        done.append(item)
+                    except Exception as e:
+                        fail(item, e)
+                    finally:
+                        in_flight.release()
+                try:
+                    if done and on_done is not None:
+                        on_done(done)
+                    if progress is not None and entries:
+                        progress.update(len(entries))
+                except Exception as e:
+                    abort(e)
+                if stop:
+                    return
+
+        threads = [threading.Thread(target=feed, daemon=True)]
+        threads += [threading.Thread(target=read, daemon=True) for _ in range(self.readers)]
+        writers = [threading.Thread(target=write, daemon=True) for _ in range(self.writers)]
+        for t in threads + writers:
+            t.start()
+
+        pending = [0]  # submitted batches whose results are not queued yet
+        cond = threading.Condition()
+
+        def queue_results(items, future):
+            try:
+                results = future.result()
+            except Exception as e:
+                results = [(False, e)] * len(items)
+            for item, (ok, result) in zip(items, results):
+                write_q.put((item, ok, result))
+            with cond:
+                pending[0] -= 1
+                cond.notify_all()
+
+        with self._executor() as executor:
+            stopped = 0
+            while stopped < self.readers:
+                # batch what is already read, without waiting for more
+                batch = [read_q.get()]
+                while len(batch) < self.compute_batch:
+                    try:
+                        batch.append(read_q.get_nowait())
+                    except queue.Empty:
+                        break
+                stopped += sum(entry is _STOP for entry in batch)
+                batch = [entry for entry in batch if entry is not _STOP]
+                if not batch:
+                    continue
+                items = [item for item, _ in batch]
+                if not aborted.is_set():
+                    try:
+                        future = executor.submit(_compute_many, self.compute_fn,
+                                                 [payload for _, payload in batch])
+                    except Exception as e:
+                        abort(e)
+                    else:
+                        with cond:
+                            pending[0] += 1
+                        future.add_done_callback(partial(queue_results, items))
+                        continue
+                for _ in items:
+                    in_flight.release()
+            with cond:
+                cond.wait_for(lambda: pending[0] == 0)
+        # every result is queued
+        for _ in range(self.writers):
+            write_q.put(_STOP)
+        for t in threads + writers:
+            t.join()
+        if errors:
+            raise errors[0]
+        return failed
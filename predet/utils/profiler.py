@@ -0,0 +1,118 @@
+import json
+import time
+import threading
+from typing import Dict
+
+
+class _NullStage(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage(object):
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.profiler.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Profiler(object):
+    ''' lightweight per-stage timing and throughput counters
+
+    example:
+        profiler = Profiler()
+        with profiler.stage('xml_parse'):
+            Xml.parse_xml_info(xml_path)
+        profiler.add_bytes('file_read', nbytes)
+        print(profiler.summary())
+
+    Stage seconds are summed over threads, so with a thread pool they can
+    exceed the wall time. When disabled, stage() returns a shared no-op
+    context and add()/add_bytes() return at once. Counters are kept per
+    process, stages run in worker processes are not collected.
+    '''
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self._stats = {}  # name: [count, seconds, bytes]
+        self._start = time.perf_counter()
+
+    def stage(self, name: str):
+        ''' context manager timing one call of a stage
+        '''
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def add(self, name: str, seconds=0., count=1, nbytes=0):
+        if not self.enabled:
+            return
+        with self._lock:
+            stat = self._stats.setdefault(name, [0, 0., 0])
+            stat[0] += count
+            stat[1] += seconds
+            stat[2] += nbytes
+
+    def add_bytes(self, name: str, nbytes: int):
+        ''' add bytes read / written by a stage without counting a call
+        '''
+        self.add(name, count=0, nbytes=nbytes)
+
+    def summary(self) -> Dict:
+        ''' structured summary of all stages
+
+        Return:
+            [dict], {'wall_seconds': float,
+                     'stages': {name: {'count', 'seconds', 'bytes',
+                                       'items_per_second', 'mb_per_second'}, ...}}
+        '''
+        wall = time.perf_counter() - self._start
+        stages = {}
+        with self._lock:
+            for name, (count, seconds, nbytes) in self._stats.items():
+                stages[name] = dict(
+                    count=count, seconds=seconds, bytes=nbytes,
+                    items_per_second=count / wall if wall > 0 else 0.,
+                    mb_per_second=nbytes / 1024**2 / wall if wall > 0 else 0.)
+        return dict(wall_seconds=wall, stages=stages)
+
+    def to_json(self, out_path: str=None) -> str:
+        ''' dump summary as json string, and save to out_path if given
+        '''
+        text = json.dumps(self.summary(), indent=2)
+        if out_path:
+            with open(out_path, 'w') as f:
+                f.write(text)
+        return text
+
+    def __getstate__(self):
+        # profilers are sent to worker processes with their owners, the
+        # copies start empty and are not merged back
+        return dict(enabled=self.enabled)
+
+    def __setstate__(self, state):
+        self.__init__(state['enabled'])
+
+
+NULL_PROFILER = Profiler(enabled=False)
@@ -0,0 +1,87 @@
+import json
+import heapq
+from pathlib import Path
+from typing import List, Dict
+
+
+def split_shards(items: List, num_shards=1, shard_index=0, weights: List=None) -> List:
+    ''' deterministic split of items for distributed runs
+
+    Items are ordered by their string form, so every node gets the same
+    split regardless of listing order. Without weights items are dealt
+    round robin, otherwise they are greedily assigned (largest first) to
+    the least loaded shard so shards take similar time.
+
+    Args:
+        items: [list], inputs, e.g. image or xml paths
+        num_shards: [int], total shard number
+        shard_index: [int], index of current shard, in [0, num_shards)
+        weights: [list], optional cost of each item, e.g. pixel number
+
+    Return:
+        [list], items of current shard, in sorted order
+    '''
+    assert 0 <= shard_index < num_shards, \
+        f"invalid shard index {shard_index} of {num_shards} shards!"
+    if num_shards == 1:
+        return list(items)
+    order = sorted(range(len(items)), key=lambda i: str(items[i]))
+    if weights is None:
+        return [items[i] for i in order[shard_index::num_shards]]
+
+    loads = [(0, s) for s in range(num_shards)]
+    selected = []
+    for i in sorted(order, key=lambda i: -weights[i]):
+        load, s = heapq.heappop(loads)
+        if s == shard_index:
+            selected.append(i)
+        heapq.heappush(loads, (load + weights[i], s))
+    return [items[i] for i in sorted(selected, key=lambda i: str(items[i]))]
+
+
+def manifest_path(out_dir: str, num_shards: int, shard_index: int) -> Path:
+    return Path(out_dir).joinpath(f'shard-{shard_index:05d}-of-{num_shards:05d}.manifest')
+
+
+def write_manifest(out_dir: str, num_shards: int, shard_index: int, inputs: List):
+    ''' record the inputs finished by one shard
+
+    Args:
+        inputs: [list], finished input paths, only names are saved
+    '''
+    p = manifest_path(out_dir, num_shards, shard_index)
+    data = dict(num_shards=num_shards, shard_index=shard_index,
+                inputs=sorted(Path(str(i)).name for i in inputs))
+    with p.open('w') as f:
+        json.dump(data, f)
+
+
+def verify_shards(out_dir: str, inputs: List, num_shards: int) -> Dict:
+    ''' merge shard manifests and check every input was processed exactly once
+
+    Args:
+        out_dir: [str], shared output directory (or merged manifests)
+        inputs: [list], all input paths of the job
+        num_shards: [int], total shard number
+
+    Return:
+        [dict], missing_shards, missing, duplicated, unexpected and ok
+    '''
+    expected = set(Path(str(i)).name for i in inputs)
+    counts = {}
+    missing_shards = []
+    for shard_index in range(num_shards):
+        p = manifest_path(out_dir, num_shards, shard_index)
+        if not p.exists():
+            missing_shards.append(shard_index)
+            continue
+        with p.open('r') as f:
+            for name in json.load(f)['inputs']:
+                counts[name] = counts.get(name, 0) + 1
+    result = dict(
+        missing_shards=missing_shards,
+        missing=sorted(expected - set(counts)),
+        duplicated=sorted(name for name, n in counts.items() if n > 1),
+        unexpected=sorted(set(counts) - expected))
+    result['ok'] = not any(result.values())
+    return result